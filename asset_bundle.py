@@ -0,0 +1,114 @@
+'''
+Packs the files of an asset directory into one bundle file, made up of an index followed by the file contents.
+
+Bundles are memory-mapped, so opening one doesn't read any files until their bytes are used.
+The bundle of a directory is saved in the cache, and is only packed again when a file is newer than it.
+'''
+
+import json
+import mmap
+import os
+import struct
+
+import constants
+
+MAGIC = b"GIMB"
+BUNDLE_VERSION = 1
+HEADER = struct.Struct("<4sII") # Magic, version, index length
+
+
+class AssetBundle:
+    """A memory-mapped bundle of files, which are looked up by name."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as bundle_file:
+            self._mmap = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != BUNDLE_VERSION:
+            self.close()
+            raise ValueError("Not a version {} asset bundle: {}".format(BUNDLE_VERSION, path))
+        self.index = json.loads(bytes(self._mmap[HEADER.size:HEADER.size+index_length]))
+        self._data_start = HEADER.size + index_length
+
+    def __contains__(self, name):
+        return name in self.index["files"]
+
+    def __len__(self):
+        return len(self.index["files"])
+
+    def names(self):
+        """Return the names of the files in the bundle."""
+        return list(self.index["files"])
+
+    def get_bytes(self, name):
+        """Return the contents of a file as a memoryview of the bundle, which is only read from disk when used."""
+        offset, length = self.index["files"][name]
+        start = self._data_start + offset
+        return memoryview(self._mmap)[start:start+length]
+
+    def close(self):
+        """Unmap the bundle. Memoryviews of it have to be released first."""
+        self._mmap.close()
+
+
+def build(paths, bundle_path, newest):
+    """Pack a dictionary of names to file paths into a bundle file."""
+    files = {}
+    blobs = []
+    offset = 0
+    for name, path in sorted(paths.items()):
+        with open(path, 'rb') as asset_file:
+            blob = asset_file.read()
+        files[name] = (offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    index = json.dumps({"newest": newest, "files": files}).encode()
+    os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+    temp_path = bundle_path + ".tmp"
+    with open(temp_path, 'wb') as bundle_file:
+        bundle_file.write(HEADER.pack(MAGIC, BUNDLE_VERSION, len(index)))
+        bundle_file.write(index)
+        for blob in blobs:
+            bundle_file.write(blob)
+    os.replace(temp_path, bundle_path) # So a half written bundle is never opened
+
+
+def _asset_paths(directory, extensions):
+    """Return a dictionary of names without extensions to the paths of files in a directory."""
+    return {
+        os.path.splitext(entry.name)[0]: entry.path
+        for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.endswith(extensions)
+    }
+
+
+def _load_cached(bundle_path, paths, newest):
+    """Return the cached bundle, or None if it is missing or older than newest."""
+    try:
+        bundle = AssetBundle(bundle_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if bundle.index.get("newest", 0) < newest or set(bundle.names()) != set(paths):
+        bundle.close()
+        return None
+    return bundle
+
+
+def load(name, directory, extensions):
+    """Return the bundle of the files in a directory ending with one of the extensions.
+
+    It is loaded from the cache, or packed again if the cache is out of date.
+    Returns None if the bundle can't be saved to the cache.
+    """
+    paths = _asset_paths(directory, tuple(extensions))
+    newest = max((os.path.getmtime(path) for path in paths.values()), default=0)
+    bundle_path = os.path.join(constants.ASSET_BUNDLE_CACHE, name + ".bundle")
+    bundle = _load_cached(bundle_path, paths, newest)
+    if bundle is None:
+        try:
+            build(paths, bundle_path, newest)
+            bundle = AssetBundle(bundle_path)
+        except OSError:
+            return None
+    return bundle
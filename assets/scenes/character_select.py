@@ -12,6 +12,10 @@ from .scene import Scene
 
 class CharacterSelect(Scene):
     """Allows you to choose who you play as. Opens at new game."""
+    scene_properties = {
+        **Scene.scene_properties,
+        "tracks_dirty_rects": True
+    }
     characters = ("magnum", "mecha", "edward")
     num_characters = 3
     character_desc = (
@@ -52,6 +56,7 @@ class CharacterSelect(Scene):
         ]
 
     def handle_input(self, keypress):
+        self.mark_dirty()
         if keypress.has_action(key_input.Action.RIGHT):
             self.cursor_pos = min(self.cursor_pos+1, 2)
 
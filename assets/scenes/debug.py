@@ -43,10 +43,22 @@ class Debug(Scene):
             "FPS: " + str(self.game.fps),
             "TOTAL IMAGES: " + str(self.game.renderer.total_images),
             "OBJECTS: " + str(len([*self.parent.world.get_component(c.TilePosition)])),
-            "SCENES: " + str(self.__how_many_scenes(self.game.base_scene))
+            "SCENES: " + str(self.__how_many_scenes(self.game.base_scene)),
+            *self.__sprite_cache_info()
         )
         return info
 
+    def __sprite_cache_info(self):
+        """Return a list of text about the sprite cache and each of its key families."""
+        sprite_cache = self.game.renderer.sprite_cache
+        info = ["SPRITE CACHE: " + str(len(sprite_cache)) + " " + str(sprite_cache.bytes // 1024) + "KB"]
+        for family, stats in sprite_cache.stats.items():
+            info.append(
+                family.upper() + ": " + str(stats.entries) + " " + str(stats.bytes // 1024) + "KB"
+                + " HITS " + str(stats.hits) + " MISSES " + str(stats.misses) + " EVICTED " + str(stats.evictions)
+            )
+        return info
+
     def __how_many_scenes(self, scene):
         """Return how many scenes there are below and including this scene.
 
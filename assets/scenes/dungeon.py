@@ -1,7 +1,8 @@
 """Contains the Dungeon scene."""
 
 import os
-import random
+import time
+from concurrent import futures
 
 import pygame
 
@@ -10,7 +11,10 @@ import constants
 import dungeon_gen
 import entity_templates
 import key_input
+import level_cache
 import level_gen
+import level_snapshots
+import random_streams
 import systems as s
 from ecs import World
 
@@ -25,7 +29,13 @@ class Dungeon(Scene):
 
     Some of this will likely have to be seperated out into a 'Game' scene when more
     than one dungeon exists in the game e.g. game_time, kills, etc.
+
+    The dungeon draws nothing itself, so it only marks the screen dirty when the world its child scenes draw is replaced.
     """
+    scene_properties = {
+        **Scene.scene_properties,
+        "tracks_dirty_rects": True
+    }
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -35,6 +45,13 @@ class Dungeon(Scene):
         self.level_num = 1
         self.world: World = None
         self.dungeon_network = None
+        self._pregenerated_levels = {}
+        self.level_snapshots = level_snapshots.SnapshotStore(constants.LEVEL_SNAPSHOT_MEMORY_BYTES, constants.LEVEL_BUILD_BATCH)
+        self._left_levels = {} # Node positions of levels with snapshots to their player start and level number
+        self._player_start = None
+        self._entered_level_num = None
+        self._staged_levels = {} # Node positions to [staging key, first entity ID, level builder, built level or None]
+        self._draw_keys = {}
 
     def handle_input(self, keypress):
         if keypress.key == pygame.K_F10: # Save
@@ -56,6 +73,7 @@ class Dungeon(Scene):
     def update(self, delta):
         if not self.paused:
             self.game_time += delta * 0.001
+        self.level_snapshots.work(constants.LEVEL_STAGING_BUDGET) # Compress the snapshot of the level just left
 
     def is_blinking(self):
         """Return True if blinking images should be lit up at the moment."""
@@ -107,45 +125,244 @@ class Dungeon(Scene):
         # Returning dictionary
         return data
 
+    def entity_draw_key(self, entity):
+        """Return a hashable key of an entity's draw data.
+
+        The key is cached until the entity's World.entity_version changes or its blinking image is lit up or not.
+        """
+        render = self.world.entity_component(entity, c.Render)
+        blinking = render.blinking and self.is_blinking()
+        version = self.world.entity_version(entity)
+        cached = self._draw_keys.get(entity)
+        if cached is not None and cached[0] == version and cached[1] == blinking:
+            return cached[2]
+        draw_key = tuple(sorted(self.entity_draw_data(entity).items()))
+        self._draw_keys[entity] = (version, blinking, draw_key)
+        return draw_key
+
+    def _forget_draw_key(self, entity):
+        """Drop the cached draw key of an entity which has left the current World."""
+        self._draw_keys.pop(entity, None)
+
     def draw_centered_entity(self, surface, entity, scale, pos):
         """Draw an entity, including icons etc."""
-        entity_surface = self.game.renderer.entity_image(scale, **self.entity_draw_data(entity))
+        entity_surface = self.game.renderer.entity_image(scale, self.entity_draw_key(entity))
         self.game.renderer.draw_centered_image(surface, entity_surface, pos)
 
     def show_level(self):
         """Add the level scene and focus on it."""
         self.game.set_focus(self.add_child_scene(Level, self.world))
 
-    def generate_level(self, properties):
-        """Generate a level depending on how far the player is."""
-
+    def _get_gridsize(self):
+        """Return the size of the level grid."""
         g_sys = self.world.get_system(s.GridSystem)
-        gridsize = (g_sys.gridwidth, g_sys.gridheight)
-        if "boss" in properties:
-            level = level_gen.generate_fly_boss_level(gridsize)
-        else:
-            level_type = "normal"
-            if "fire" in properties:
-                level_type = "fire"
-            level = level_gen.generate_random_level(gridsize, self.level_num, level_type)
+        return (g_sys.gridwidth, g_sys.gridheight)
 
-        for components in level.entities:
-            self.world.create_entity(*components)
-        self.world.add_component(self.world.tags.player, c.TilePosition(*level.player_start))
+    def _get_level_args(self, node):
+        """Return the cache key, grid size, level number, properties and seed of the level for a node."""
+        gridsize = self._get_gridsize()
+        level_type = level_gen.get_level_type(node.properties)
+        key = level_cache.level_key(gridsize, random_streams.get_master_seed(), node.pos, self.level_num, level_type)
+        seed = random_streams.derive_seed("level", node.pos, self.level_num)
+        return key, gridsize, self.level_num, tuple(node.properties), seed
+
+    def pregenerate_levels(self, nodes):
+        """Start generating the levels of dungeon nodes in a worker process, storing them in the level cache.
+
+        Any previously pregenerated or staged levels are discarded, since they were made for an older level number.
+        """
+        self.discard_pregenerated_levels()
+        self._staged_levels.clear()
+        for node in nodes:
+            future = self.game.worker_pool.submit(level_cache.cache_level, *self._get_level_args(node))
+            self._pregenerated_levels[node.pos] = future
+
+    def discard_pregenerated_levels(self):
+        """Cancel or discard any levels being pregenerated."""
+        for future in self._pregenerated_levels.values():
+            future.cancel()
+        self._pregenerated_levels.clear()
+
+    def stage_level(self, node):
+        """Build the level of a node in a staging World ahead of time, so that entering it is only a World swap.
+
+        The level is built over several calls, spending up to constants.LEVEL_STAGING_BUDGET seconds in each,
+        and is only built once for each node. Nothing is built while the node's level is still being pregenerated.
+        Returns True once the level is staged.
+        """
+        if not node.can_be_explored and node.pos not in self.level_snapshots:
+            return False
+        staged = self._staged_levels.get(node.pos)
+        if staged is None or staged[0] != self._get_staging_key(node):
+            staged = [self._get_staging_key(node), self.world.last_entity_id, self._level_builder(node), None]
+            self._staged_levels[node.pos] = staged
+        if staged[3] is not None:
+            return True
+
+        t_end = time.perf_counter() + constants.LEVEL_STAGING_BUDGET
+        try:
+            while time.perf_counter() < t_end:
+                waiting = next(staged[2])
+                if waiting is not None and not waiting.done():
+                    return False
+        except StopIteration as stop:
+            staged[3] = stop.value
+        return staged[3] is not None
+
+    def _get_staging_key(self, node):
+        """Return what a staged level has to match to be used for a node."""
+        return (node.pos, self.level_num)
+
+    def _get_staged_level(self, node):
+        """Return the World and player start of a node's staged level, finishing building it if needed.
+
+        Returns None if there is no staged level or it can't be used, e.g. since its entity IDs are taken.
+        """
+        staged = self._staged_levels.get(node.pos)
+        if staged is None or staged[0] != self._get_staging_key(node) or self.world.last_entity_id > staged[1]:
+            return None
+        if staged[3] is None:
+            staged[3] = self._run_level_builder(staged[2])
+        return staged[3]
+
+    def _build_level(self, node):
+        """Build the level of a node in a new World, returning the World and the player start."""
+        return self._run_level_builder(self._level_builder(node))
+
+    @staticmethod
+    def _run_level_builder(builder):
+        """Run a level builder to the end, returning what it returns.
+
+        Waits for any future the builder yields to finish before carrying on.
+        """
+        try:
+            while True:
+                waiting = next(builder)
+                if waiting is not None:
+                    futures.wait((waiting,))
+        except StopIteration as stop:
+            return stop.value
+
+    def _level_builder(self, node):
+        """Return a generator which builds the level of a node in a new World, pausing between batches of entities.
+
+        It returns the World and the player start. If the level has been left before, it is restored from its snapshot.
+        Otherwise it yields the future of the level's pregeneration until that is done, then loads it from the level cache.
+        Its entities draw from random streams of the level's own, so the level is the same however it is built.
+        """
+        world = self._create_world(self.world.last_entity_id)
+        if node.pos in self.level_snapshots:
+            return world, self._restore_level(node, world)
+
+        level = None
+        future = self._pregenerated_levels.get(node.pos)
+        while future is not None and not future.done():
+            yield future
+        if future is not None and not future.cancelled():
+            data = future.result()
+            if data is not None: # The level couldn't be cached
+                level = level_gen.Level.from_bytes(data)
+        if level is None:
+            level = level_cache.load_or_generate(*self._get_level_args(node))
+        yield
+
+        with random_streams.StreamScope("level", node.pos, self.level_num):
+            entities = level.create_entities()
+        for start in range(0, len(entities), constants.LEVEL_BUILD_BATCH):
+            yield
+            for components in entities[start:start+constants.LEVEL_BUILD_BATCH]:
+                world.create_entity(*components)
+        yield
+
+        world.get_system(s.GridSystem).process()
+        return world, tuple(level.player_start)
+
+    def generate_level(self, node):
+        """Make the level of a dungeon node the current level, using the staged level if there is one.
+
+        The player and their inventory are moved into the level's World, which then replaces the current one.
+        """
+        staged_level = self._get_staged_level(node)
+        if staged_level is not None:
+            world, player_start = staged_level
+        else:
+            world, player_start = self._build_level(node)
+        self._staged_levels.clear()
+        self.discard_pregenerated_levels()
+        self.level_snapshots.discard(node.pos)
+        if node.pos in self._left_levels: # Revisited levels keep their number, so their difficulty doesn't change
+            _, self.level_num = self._left_levels.pop(node.pos)
+        self._entered_level_num = self.level_num
+
+        player = self.world.tags.player
+        player_entities = [player, *self.world.entity_component(player, c.Inventory).contents]
+        self.world.move_entities(player_entities, world)
+        world.tags = self.world.tags
+        self.world = world
+        self._draw_keys.clear()
+        world.add_removal_observer(self._forget_draw_key)
+        self.mark_dirty()
+
+        grid = self.world.get_system(s.GridSystem)
+        self._player_start = player_start
+        pos = player_start
+        if grid.get_blocker_at(pos) != 0: # Something has moved onto the player start of a restored level
+            pos = grid.random_adjacent_free_pos(pos) or grid.random_free_pos()
+        self.world.add_component(player, c.TilePosition(*pos))
 
         if self.level_num == 1:
-            self.world.add_component(self.world.tags.player, c.FreeTurn(1)) # To fix off-by-one turn timing
-            inv = self.world.entity_component(self.world.tags.player, c.Inventory)
+            self.world.add_component(player, c.FreeTurn(1)) # To fix off-by-one turn timing
+            inv = self.world.entity_component(player, c.Inventory)
             for _ in range(3):
                 # This code will create the bomb, remove its tile position then
                 # manually put it into the player's inventory.
                 bomb = self.world.create_entity(*entity_templates.bomb(0, 0))
                 self.world.remove_component(bomb, c.TilePosition)
-                self.world.add_component(bomb, c.Stored(self.world.tags.player))
+                self.world.add_component(bomb, c.Stored(player))
                 inv.contents.append(bomb)
-        else:
-            self.world.remove_component(self.world.tags.player, c.MyTurn) # To fix off-by-one turn timing
-        self.world.get_system(s.GridSystem).process() # Fixes glitch with no collision on first turn of level
+        elif self.world.has_component(player, c.MyTurn):
+            self.world.remove_component(player, c.MyTurn) # To fix off-by-one turn timing
+        grid.process() # Fixes glitch with no collision on first turn of level
+
+    def save_level_state(self, entities):
+        """Store a snapshot of the entities of the level being left, so it can be restored if it is revisited.
+
+        Dead entities and components only used within a turn are left out.
+        """
+        snapshot = {}
+        for entity in entities:
+            if self.world.has_component(entity, c.Dead) or self.world.has_component(entity, c.Delete):
+                continue
+            snapshot[entity] = [
+                component for component in self.world.entity_components(entity)
+                if not isinstance(component, (c.MyTurn, c.Bump, c.Delete))
+            ]
+        pos = self.dungeon_network.player_node.pos
+        self.level_snapshots.store(pos, snapshot)
+        self._left_levels[pos] = (self._player_start, self._entered_level_num)
+
+    def _restore_level(self, node, world):
+        """Recreate the entities of a level from its snapshot in a World, returning the level's player start."""
+        player = self.world.tags.player
+        player_start, _ = self._left_levels[node.pos]
+        snapshot = self.level_snapshots.get(node.pos)
+
+        # Entity IDs are different once recreated, so references to other entities are changed to match
+        new_ids = {entity: world.create_entity(*components) for entity, components in snapshot.items()}
+        for _, boss in world.get_component(c.Boss):
+            boss.minions = [new_ids[minion] for minion in boss.minions if minion in new_ids]
+        for _, ai in world.get_component(c.AI):
+            if ai.target in new_ids:
+                ai.target = new_ids[ai.target]
+            elif ai.target != player:
+                ai.target = 0
+        for _, stored in world.get_component(c.Stored):
+            stored.carrier = new_ids.get(stored.carrier, stored.carrier)
+        for _, inventory in world.get_component(c.Inventory):
+            inventory.contents = [new_ids[item] for item in inventory.contents if item in new_ids]
+
+        world.get_system(s.GridSystem).process()
+        return player_start
 
     def get_health_bar_color(self, health_comp):
         """Return what color an entity's health bar should be given its health component."""
@@ -183,36 +400,44 @@ class Dungeon(Scene):
 
     def init_world(self):
         """Initialise for a new game."""
-        self.world = World()
-
-        self.world.add_system(s.GridSystem())
-        self.world.add_system(s.InitiativeSystem())
-
-        self.world.add_system(s.PlayerInputSystem())
-        self.world.add_system(s.AIFlyWizardSystem())
-        self.world.add_system(s.AISystem())
-        self.world.add_system(s.FreezingSystem())
-        self.world.add_system(s.BurningSystem())
-        self.world.add_system(s.AIDodgeSystem())
-        self.world.add_system(s.BumpSystem())
-
-        self.world.add_system(s.ExplosionSystem())
-        self.world.add_system(s.DamageSystem())
-        self.world.add_system(s.RegenSystem())
-        self.world.add_system(s.PickupSystem())
-        self.world.add_system(s.IdleSystem())
-        self.world.add_system(s.SplitSystem())
-        self.world.add_system(s.StairsSystem())
-
-        self.world.add_system(s.AnimationSystem())
-
-        self.world.add_system(s.DeadSystem())
-        self.world.add_system(s.DeleteSystem())
+        self.world = self._create_world()
+        self._draw_keys.clear()
+        self.world.add_removal_observer(self._forget_draw_key)
+
+    def _create_world(self, last_entity_id=0):
+        """Return a new World with all of the game's systems."""
+        world = World(last_entity_id)
+
+        world.add_system(s.GridSystem())
+        world.add_system(s.InitiativeSystem())
+
+        world.add_system(s.PlayerInputSystem())
+        world.add_system(s.AIFlyWizardSystem())
+        world.add_system(s.AISystem())
+        world.add_system(s.FreezingSystem())
+        world.add_system(s.BurningSystem())
+        world.add_system(s.AIDodgeSystem())
+        world.add_system(s.BumpSystem())
+
+        world.add_system(s.ExplosionSystem())
+        world.add_system(s.DamageSystem())
+        world.add_system(s.RegenSystem())
+        world.add_system(s.PickupSystem())
+        world.add_system(s.IdleSystem())
+        world.add_system(s.SplitSystem())
+        world.add_system(s.StairsSystem())
+
+        world.add_system(s.AnimationSystem())
+
+        world.add_system(s.DeadSystem())
+        world.add_system(s.DeleteSystem())
+        return world
 
     def new_game(self):
-        """Set the seed then generate a level."""
-        if constants.SEED is not None:
-            random.seed(constants.SEED)
+        """Set the master seed then generate the dungeon layout."""
+        random_streams.seed(constants.SEED)
 
         self.dungeon_network = dungeon_gen.generate_dungeon_layout()
+        self.level_snapshots = level_snapshots.SnapshotStore(constants.LEVEL_SNAPSHOT_MEMORY_BYTES, constants.LEVEL_BUILD_BATCH)
+        self._left_levels = {}
         self.game.set_focus(self.add_child_scene(LevelSelect))
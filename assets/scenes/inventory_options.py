@@ -6,6 +6,7 @@ import audio
 import components as c
 import constants
 import key_input
+import systems as s
 import widget as wgt
 from misc import DynamicPos
 
@@ -82,6 +83,7 @@ class InventoryOptions(Scene):
 
             if selection == "prime":
                 self.world.entity_component(self.item, c.Explosive).primed = True
+                self.world.mark_changed(self.item)
 
             if selection == "throw":
                 self.visible = False
@@ -96,6 +98,7 @@ class InventoryOptions(Scene):
 
                 pos = self.world.entity_component(self.world.tags.player, c.TilePosition)
                 self.world.add_component(self.item, c.TilePosition(pos.x, pos.y))
+                self.world.get_system(s.GridSystem).insert(self.item)
 
         if keypress.has_action(key_input.Action.INVENTORY_CLOSE):
             self.remove_scene()
@@ -1,10 +1,9 @@
 """Contains the Level scene."""
 
-import random
-
 import audio
 import components as c
 import key_input
+import random_streams
 import systems as s
 from camera import Camera
 from ecs import World
@@ -30,6 +29,7 @@ class Level(Scene):
 
         self.keypresses = []
         self.player_alive = True
+        self.left = False # Once the player has taken the stairs, the World is no longer processed
 
         self.add_child_scene(Viewport)
         self.add_child_scene(HUD)
@@ -53,12 +53,16 @@ class Level(Scene):
 
 
     def update(self, delta):
+        if self.left:
+            return
         if not self.player_alive:
             self.keypresses = []
         self.world.process(playerinputs=self.keypresses, d_t=delta)
         self.keypresses = []
-        while not self.world.has_component(self.world.tags.player, c.MyTurn) and self.player_alive: # Waiting for input
+        while not self.world.has_component(self.world.tags.player, c.MyTurn) and self.player_alive and not self.left: # Waiting for input
             self.world.process(playerinputs=[], d_t=0)
+        if self.left:
+            return
 
         # Move the camera towards the player and update it
         cameragoal = self.__player_pos_to_camera_pos()
@@ -83,11 +87,13 @@ class Level(Scene):
 
     def select_next_level(self):
         """Open the LevelSelect scene."""
+        self.left = True
         self.remove_scene()
         self.game.set_focus(self.parent.add_child_scene(LevelSelect))
 
     def show_win_screen(self):
         """Show the win screen."""
+        self.left = True
         self.game.remove_focus(self)
         self.game.set_focus(self.add_child_scene(GameOver, self.parent, victory=True))
 
@@ -108,9 +114,10 @@ class Level(Scene):
     def teleport_entity(self, entity, amount):
         """Teleport an entity to a random position in a specific radius."""
         pos = self.world.entity_component(entity, c.TilePosition)
+        rng = random_streams.stream("teleport")
         while True:
-            randpos = (pos.x+random.randint(-amount, amount),
-                       pos.y+random.randint(-amount, amount))
+            randpos = (pos.x+rng.randint(-amount, amount),
+                       pos.y+rng.randint(-amount, amount))
             if self.world.get_system(s.GridSystem).on_grid(randpos):
                 if self.world.get_system(s.GridSystem).get_blocker_at(randpos) == 0:
                     self.world.get_system(s.GridSystem).move_entity(entity, randpos)
@@ -120,6 +127,7 @@ class Level(Scene):
         """Give an entity free turns."""
         if self.world.has_component(entity, c.FreeTurn):
             self.world.entity_component(entity, c.FreeTurn).life += amount
+            self.world.mark_changed(entity)
         else:
             self.world.add_component(entity, c.FreeTurn(amount))
 
@@ -10,7 +10,14 @@ from .scene import Scene
 
 
 class LevelSelect(Scene):
-    """Displays the dungeon layout and lets the player choose which level to go to."""
+    """Displays the dungeon layout and lets the player choose which level to go to.
+
+    Only the nodes which have changed are redrawn each frame.
+    """
+    scene_properties = {
+        **Scene.scene_properties,
+        "tracks_dirty_rects": True
+    }
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.background_surface = pygame.Surface((self.game.width, self.game.height))
@@ -20,57 +27,72 @@ class LevelSelect(Scene):
         self.dungeon_center_y = 120 * constants.MENU_SCALE
 
         self.network = self.parent.dungeon_network
+        self._entering_node = None # The chosen node, which is entered once its level is staged
 
-        self.widgets = []
-        for node in self.parent.dungeon_network.get_nodes():
-            self.widgets.append(wgt.LevelNode(renderer=self.game.renderer, node=node, offset=self.__node_to_screen_pos(node)))
-        self.__update_explorable_nodes()
-
-    def __update_explorable_nodes(self):
-        """Update which nodes can be explored.
-
-        A node which can be eplored has not been explored yet
-        but is next to one which has been.
-        """
-
-        for node in self.network.get_nodes():
-            node.can_be_explored = False
-            if not node.explored:
-                for direction in constants.DIRECTIONS:
-                    adj_node = node.connections[direction]
-                    if adj_node is not None:
-                        if adj_node.explored:
-                            node.can_be_explored = True
-                if "start" in node.properties:
-                    node.can_be_explored = True
+        self.widgets = {} # Node positions to widgets, made once their nodes are on the screen
+        # Generate levels in the background while the player is choosing
+        self.parent.pregenerate_levels(self.network.get_explorable_nodes())
 
     def handle_input(self, keypress):
+        if self._entering_node is not None:
+            return True
         if keypress.has_action(key_input.Action.DIRECTION):
             player_node = self.network.player_node
             node = player_node.connections[keypress.get_direction()]
             if node is not None:
                 if node.explored or node.can_be_explored:
                     self.network.player_node = node
+                    self.mark_dirty(self.__node_rect(player_node))
+                    self.mark_dirty(self.__node_rect(node))
 
             return True
 
         if keypress.has_action(key_input.Action.ACCEPT):
             node = self.network.player_node
-            if node.can_be_explored:
-                node.explored = True
-                self.parent.generate_level(node.properties)
-                self.parent.show_level()
-                self.remove_scene()
+            if node.can_be_explored or node.pos in self.parent.level_snapshots:
+                self._entering_node = node
             return True
 
+    def __enter_node(self, node):
+        """Go to the level of a node."""
+        if node.can_be_explored:
+            self.network.explore(node)
+        self.parent.generate_level(node)
+        self.parent.show_level()
+        self.remove_scene()
+
+    def __get_widget(self, node):
+        """Return the widget of a node, making it the first time it is needed."""
+        if node.pos not in self.widgets:
+            self.widgets[node.pos] = wgt.LevelNode(renderer=self.game.renderer, node=node, offset=self.__node_to_screen_pos(node))
+        return self.widgets[node.pos]
+
+    def __get_visible_nodes(self):
+        """Return a list of the nodes which are on the screen, including ones just off of it."""
+        min_pos = (int((0 - self.dungeon_center_x) // (50 * constants.MENU_SCALE)) - 1,
+                   int((0 - self.dungeon_center_y) // (40 * constants.MENU_SCALE)) - 1)
+        max_pos = (int((self.game.width - self.dungeon_center_x) // (50 * constants.MENU_SCALE)) + 1,
+                   int((self.game.height - self.dungeon_center_y) // (40 * constants.MENU_SCALE)) + 1)
+        return self.network.get_nodes_in_rect(min_pos, max_pos)
+
     def update(self, delta):
-        for widget in self.widgets:
+        # Build the chosen level while the player is choosing, so entering it is instant
+        staged = self.parent.stage_level(self.network.player_node)
+        if self._entering_node is not None and staged:
+            self.__enter_node(self._entering_node)
+            return
+        for node in self.__get_visible_nodes():
+            widget = self.__get_widget(node)
+            scale = widget.scale
             widget.update(delta)
+            if widget.scale != scale:
+                self.mark_dirty(self.__node_rect(node))
 
     def draw(self, screen):
         screen.blit(self.background_surface, (0, 0))
 
-        for node in self.network.get_nodes():
+        visible_nodes = self.__get_visible_nodes()
+        for node in visible_nodes:
             for direction in (constants.DOWN, constants.RIGHT):
                 if node.connections[direction] is not None:
                     other_node = node.connections[direction]
@@ -81,12 +103,19 @@ class LevelSelect(Scene):
                     end = self.__node_to_screen_pos(other_node)
                     pygame.draw.line(screen, color, start, end, max(int(2.5*constants.MENU_SCALE), 1))
 
-        for widget in self.widgets:
-            widget.draw(screen)
+        for node in visible_nodes:
+            self.__get_widget(node).draw(screen)
 
         player_pos = self.__node_to_screen_pos(self.network.player_node)
         self.parent.draw_centered_entity(screen, self.parent.world.tags.player, constants.MENU_SCALE, player_pos)
 
+    def __node_rect(self, node):
+        """Return a rect of the screen which a node's widget stays within."""
+        size = 60 * constants.MENU_SCALE
+        rect = pygame.Rect(0, 0, size, size)
+        rect.center = self.__node_to_screen_pos(node)
+        return rect
+
     def __node_to_screen_pos(self, node):
         """Return the position of the center of a node on the screen."""
         x = self.dungeon_center_x + node.pos[0] * 50 * constants.MENU_SCALE
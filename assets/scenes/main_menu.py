@@ -31,6 +31,7 @@ class MainMenu(Scene):
 
     def _exit_game(self):
         """Exit the game from the main menu."""
+        self.game.shutdown()
         leave()
 
     def _start_main_menu(self):
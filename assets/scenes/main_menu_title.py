@@ -1,8 +1,9 @@
 """Contains the MainMenuTitle scene."""
 
-import random
+import pygame
 
 import constants
+import random_streams
 
 from .scene import Scene
 
@@ -10,7 +11,7 @@ from .scene import Scene
 class MainMenuTitle(Scene):
     """The game title text.
 
-    It falls down then shakes."""
+    It falls down then shakes. A bar below it shows how much of the game has been preloaded."""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -35,13 +36,20 @@ class MainMenuTitle(Scene):
         else:
             if self.shake > 0:
                 self.lastshake += delta
+                rng = random_streams.stream("camera")
                 while self.lastshake > 1000/60:
                     self.lastshake -= 1000/60
-                    self.shake_x = random.uniform(-self.shake, self.shake)
-                    self.shake_y = random.uniform(-self.shake, self.shake)
+                    self.shake_x = rng.uniform(-self.shake, self.shake)
+                    self.shake_y = rng.uniform(-self.shake, self.shake)
                     self.shake *= 0.9
                     if self.shake < 1:
                         self.shake = 0
 
     def draw(self, screen):
         screen.blit(self.surface, (self.offset[0] + self.shake_x, self.offset[1] + self.shake_y))
+
+        if self.game.preloader is not None:
+            bar_rect = pygame.Rect(0, 0, 100*constants.MENU_SCALE, 2*constants.MENU_SCALE)
+            bar_rect.midbottom = (self.game.width//2, self.game.height - 20*constants.MENU_SCALE)
+            pygame.draw.rect(screen, constants.DARK_GRAY, bar_rect)
+            pygame.draw.rect(screen, constants.LIGHT_GRAY, (bar_rect.topleft, (bar_rect.width*self.game.preloader.progress, bar_rect.height)))
@@ -11,6 +11,10 @@ from .scene import Scene
 
 class OptionSelect(Scene):
     """A scene which lets the user pick from a list of options."""
+    scene_properties = {
+        **Scene.scene_properties,
+        "tracks_dirty_rects": True
+    }
     def __init__(self, options, pos, **kwargs):
         super().__init__(**kwargs)
         self.options = options
@@ -26,6 +30,7 @@ class OptionSelect(Scene):
         )
 
     def handle_input(self, keypress):
+        self.mark_dirty()
         if keypress.has_action(key_input.Action.DOWN):
             self.cursor_pos = min(len(self.options)-1, self.cursor_pos + 1)
             return True
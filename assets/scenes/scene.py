@@ -1,17 +1,22 @@
 """Contains the base Scene class."""
 
+import pygame
+
 import game_manager
 
 class Scene:
     """A node in the scene tree."""
     scene_properties = {
-        "draw_above_parent": True
+        "draw_above_parent": True,
+        "tracks_dirty_rects": False
     }
     def __init__(self, game: game_manager.GameManager, parent=None):
         self.game: game_manager.GameManager = game
         self.parent = parent
         self.children = []
         self.signals = {}
+        self._dirty_rects = None
+        game.scene_created()
 
     def add_child_scene(self, scene_type, *args, **kwargs):
         """Add a child scene given its type and input parameters."""
@@ -49,6 +54,27 @@ class Scene:
             for function in self.signals[signal_name]:
                 function(*args, **kwargs)
 
+    def mark_dirty(self, rect=None):
+        """Mark an area of the screen as changed by this scene, or the whole screen if rect is None.
+
+        Only needed in scenes with the "tracks_dirty_rects" property.
+        """
+        if rect is None:
+            self._dirty_rects = None
+        elif self._dirty_rects is not None:
+            self._dirty_rects.append(pygame.Rect(rect))
+
+    def pop_dirty_rects(self):
+        """Return the areas of the screen changed by this scene since the last call, or None if the whole screen may have.
+
+        Scenes without the "tracks_dirty_rects" property always return None.
+        """
+        if not self.scene_properties["tracks_dirty_rects"]:
+            return None
+        rects = self._dirty_rects
+        self._dirty_rects = []
+        return rects
+
     def handle_input(self, keypress):
         """Handle a user input.
 
@@ -50,6 +50,11 @@ class Settings(Scene):
         toggle.connect_signal("changed_state", lambda x: self.set_setting("fullscreen_mode", x))
         self.options.append(toggle)
 
+        toggle_pos = (toggle_pos[0], toggle_pos[1] + 20 * constants.MENU_SCALE)
+        toggle = self.add_child_scene(Toggle, "Vsync", toggle_pos, state=self.config.vsync)
+        toggle.connect_signal("changed_state", lambda x: self.set_setting("vsync", x))
+        self.options.append(toggle)
+
     def set_setting(self, setting, value):
         """Set a setting to the specified value."""
         setattr(self.config, setting, value)
@@ -87,6 +87,7 @@ class ThrowOptions(Scene):
                 self.world.entity_component(self.world.tags.player, c.Inventory).contents.remove(self.item)
                 self.world.remove_component(self.item, c.Stored)
                 self.world.add_component(self.item, c.TilePosition(*self.droptile))
+                self.world.get_system(s.GridSystem).insert(self.item)
             if self.targettile is not None:
                 target = self.world.get_system(s.GridSystem).get_blocker_at(self.targettile)
                 if target:
@@ -1,51 +1,192 @@
 """Contains the Viewport scene."""
 
+from collections import OrderedDict
+
 import pygame
 
 import components as c
 import constants
+from sprite_cache import surface_bytes
 from systems import GridSystem
 
 from .scene import Scene
 
 
+# Entities made up of only these components never change how they look, so are drawn into the floor cache
+STATIC_COMPONENTS = (
+    c.Render, c.TilePosition, c.Blocker, c.Destructible,
+    c.Stairs, c.FireElement, c.IceElement
+)
+
+
 class Viewport(Scene):
-    """The main dungeon view. Draws what the player can see of the dungeon."""
+    """The main dungeon view. Draws what the player can see of the dungeon.
+
+    The floor and static entities such as walls and stairs are pre-rendered into a floor cache of chunks,
+    which are made when they come into view and forgotten least recently used first once they take up
+    more than constants.FLOOR_CACHE_MAX_BYTES, except for chunks drawn in the current frame. Chunks are
+    about constants.FLOOR_CHUNK_PIXELS wide at any zoom. The area around a tile is redrawn, in every chunk it overlaps,
+    when the GridSystem reports that a static entity has been put on or taken off the tile. Chunks drawn with
+    approximate entity images while zooming are made again in a later frame.
+    """
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._floor_cache = None
+        self._floor_chunks = OrderedDict()
+        self._floor_chunks_bytes = 0
+        self._approximate_chunks = set()
+        self._frame_chunks = set() # Chunks drawn in the current frame, which aren't evicted
+        self._chunk_tiles = 1
         self._zoom_cache = 0
+        self._static_entities = set()
+        self._changed_tiles = set()
+        self.parent.world.get_system(GridSystem).add_tile_observer(self._tile_changed)
+
+    def _tile_changed(self, entity, pos):
+        """Mark a tile of the floor cache as needing to be redrawn if the entity is or was drawn into it."""
+        if entity in self._static_entities or self.__is_static(entity):
+            self._changed_tiles.add(pos)
+
+    def __is_static(self, entity):
+        """Return True if an entity can be drawn into the floor cache."""
+        world = self.parent.world
+        if not world.has_component(entity, c.Render) or world.entity_component(entity, c.Render).blinking:
+            return False
+        return all(isinstance(component, STATIC_COMPONENTS) for component in world.entity_components(entity))
+
+    def __draw_static_entities(self, surface, origin, grid, pos, camerascale):
+        """Draw the static entities on a tile to a floor chunk whose top-left is at origin on the map."""
+        pixelpos = self.parent.camera.tile_to_pixel_pos(*pos)
+        pixelpos = (pixelpos[0] - origin[0], pixelpos[1] - origin[1])
+        for entity in sorted(grid.get_entities_at(pos)):
+            if self.__is_static(entity):
+                self._static_entities.add(entity)
+                self.parent.draw_centered_entity(surface, entity, camerascale, pixelpos)
+            else:
+                self._static_entities.discard(entity)
+
+    def __tiles_around(self, grid, min_tile, max_tile):
+        """Return the positions on the grid between two tiles, and one tile around them."""
+        return [
+            (x, y)
+            for y in range(max(min_tile[1]-1, 0), min(max_tile[1]+2, grid.gridheight))
+            for x in range(max(min_tile[0]-1, 0), min(max_tile[0]+2, grid.gridwidth))
+        ]
+
+    def __make_floor_chunk(self, grid, chunk, camerazoom, camerascale):
+        """Return a new floor chunk surface, with the floor and static entities drawn on it."""
+        chunk_tiles = self._chunk_tiles
+        min_tile = (chunk[0]*chunk_tiles, chunk[1]*chunk_tiles)
+        max_tile = (min(min_tile[0]+chunk_tiles, grid.gridwidth)-1, min(min_tile[1]+chunk_tiles, grid.gridheight)-1)
+        origin = (min_tile[0]*camerazoom, min_tile[1]*camerazoom)
+        size = ((max_tile[0]-min_tile[0]+1)*camerazoom, (max_tile[1]-min_tile[1]+1)*camerazoom)
+
+        approximate_images = self.game.renderer.approximate_images
+        surface = pygame.Surface(size)
+        floor_image = self.game.renderer.get_image(name="floor", scale=camerascale)
+        surface.blits((
+            (floor_image, (x*camerazoom - origin[0], y*camerazoom - origin[1]))
+            for x in range(min_tile[0], max_tile[0]+1) for y in range(min_tile[1], max_tile[1]+1)
+        ), doreturn=False)
+        # Static entities just outside the chunk can overlap onto it
+        for pos in self.__tiles_around(grid, min_tile, max_tile):
+            self.__draw_static_entities(surface, origin, grid, pos, camerascale)
+        if self.game.renderer.approximate_images != approximate_images:
+            self._approximate_chunks.add(chunk)
+        return surface
+
+    def __get_floor_chunk(self, grid, chunk, camerazoom, camerascale):
+        """Get a floor chunk surface, making it if it isn't cached.
+
+        Old chunks are evicted while over budget, except for ones used in this frame.
+        """
+        self._frame_chunks.add(chunk)
+        if chunk in self._approximate_chunks:
+            self._approximate_chunks.discard(chunk)
+            self._floor_chunks_bytes -= surface_bytes(self._floor_chunks.pop(chunk))
+        elif chunk in self._floor_chunks:
+            self._floor_chunks.move_to_end(chunk)
+            return self._floor_chunks[chunk]
+
+        surface = self.__make_floor_chunk(grid, chunk, camerazoom, camerascale)
+        self._floor_chunks[chunk] = surface
+        self._floor_chunks_bytes += surface_bytes(surface)
+        while self._floor_chunks_bytes > constants.FLOOR_CACHE_MAX_BYTES and next(iter(self._floor_chunks)) not in self._frame_chunks:
+            old_chunk, old_surface = self._floor_chunks.popitem(last=False)
+            self._approximate_chunks.discard(old_chunk)
+            self._floor_chunks_bytes -= surface_bytes(old_surface)
+        return surface
+
+    def __redraw_tile(self, grid, pos, camerazoom, camerascale):
+        """Redraw the area of the floor cache which the static entities on a tile can cover, in every cached chunk it overlaps.
+
+        Sprites can overlap onto the tiles around their own, so the area is the tile and the tiles around it.
+        """
+        chunk_tiles = self._chunk_tiles
+        chunk_pixels = chunk_tiles*camerazoom
+        min_tile = (max(pos[0]-1, 0), max(pos[1]-1, 0))
+        max_tile = (min(pos[0]+1, grid.gridwidth-1), min(pos[1]+1, grid.gridheight-1))
+        floor_image = self.game.renderer.get_image(name="floor", scale=camerascale)
+        for chunk_y in range(min_tile[1] // chunk_tiles, max_tile[1] // chunk_tiles + 1):
+            for chunk_x in range(min_tile[0] // chunk_tiles, max_tile[0] // chunk_tiles + 1):
+                chunk = (chunk_x, chunk_y)
+                if chunk not in self._floor_chunks:
+                    continue
+                surface = self._floor_chunks[chunk]
+                origin = (chunk_x*chunk_pixels, chunk_y*chunk_pixels)
+                area_min = (max(min_tile[0], chunk_x*chunk_tiles), max(min_tile[1], chunk_y*chunk_tiles))
+                area_max = (min(max_tile[0], (chunk_x+1)*chunk_tiles-1), min(max_tile[1], (chunk_y+1)*chunk_tiles-1))
+
+                approximate_images = self.game.renderer.approximate_images
+                surface.set_clip((
+                    area_min[0]*camerazoom - origin[0], area_min[1]*camerazoom - origin[1],
+                    (area_max[0]-area_min[0]+1)*camerazoom, (area_max[1]-area_min[1]+1)*camerazoom
+                ))
+                surface.blits((
+                    (floor_image, (x*camerazoom - origin[0], y*camerazoom - origin[1]))
+                    for x in range(area_min[0], area_max[0]+1) for y in range(area_min[1], area_max[1]+1)
+                ), doreturn=False)
+                for tile in self.__tiles_around(grid, area_min, area_max):
+                    self.__draw_static_entities(surface, origin, grid, tile, camerascale)
+                surface.set_clip(None)
+                if self.game.renderer.approximate_images != approximate_images:
+                    self._approximate_chunks.add(chunk)
 
     def draw(self, screen):
         camerarect = self.parent.camera.get_rect()
         camerazoom = self.parent.camera.get_zoom()
         camerascale = camerazoom/constants.TILE_SIZE
+        grid = self.parent.world.get_system(GridSystem)
 
         if self._zoom_cache != camerazoom:
             self._zoom_cache = camerazoom
-
-            gridwidth = self.parent.world.get_system(GridSystem).gridwidth
-            gridheight = self.parent.world.get_system(GridSystem).gridheight
-
-            self._floor_cache = pygame.surface.Surface((gridwidth*camerazoom, gridheight*camerazoom))
-            floor_image = self.game.renderer.get_image(name="floor", scale=camerascale)
-            for x in range(0, gridwidth):
-                for y in range(0, gridheight):
-                    self._floor_cache.blit(floor_image, (x*camerazoom, y*camerazoom))
-
-        screen.blit(self._floor_cache, (0, 0), (camerarect.x, camerarect.y, camerarect.width, camerarect.height))
-
-        for entity, comps in self.parent.world.get_components(c.Render, c.TilePosition):
-            pos = comps[1]
-
-            pixelpos = self.parent.camera.tile_to_pixel_pos(pos.x, pos.y)
-            rect = pygame.Rect(0, 0, camerazoom*1.5, camerazoom*1.5)
-            rect.center = pixelpos
-
-            drawing = rect.colliderect(camerarect)
-
-            if drawing:
+            self._changed_tiles.clear()
+            self._floor_chunks.clear()
+            self._floor_chunks_bytes = 0
+            self._approximate_chunks.clear()
+            self._chunk_tiles = max(int(constants.FLOOR_CHUNK_PIXELS // camerazoom), 1)
+
+        for pos in self._changed_tiles:
+            self.__redraw_tile(grid, pos, camerazoom, camerascale)
+        self._changed_tiles.clear()
+
+        self._frame_chunks.clear()
+        chunk_pixels = self._chunk_tiles*camerazoom
+        max_chunk = ((grid.gridwidth-1) // self._chunk_tiles, (grid.gridheight-1) // self._chunk_tiles)
+        for chunk_y in range(max(camerarect.top // chunk_pixels, 0), min(camerarect.bottom // chunk_pixels, max_chunk[1]) + 1):
+            for chunk_x in range(max(camerarect.left // chunk_pixels, 0), min(camerarect.right // chunk_pixels, max_chunk[0]) + 1):
+                surface = self.__get_floor_chunk(grid, (chunk_x, chunk_y), camerazoom, camerascale)
+                screen.blit(surface, (chunk_x*chunk_pixels - camerarect.x, chunk_y*chunk_pixels - camerarect.y))
+
+        # Only entities on tiles the camera can see are visited, with a tile of margin for sprites larger than a tile
+        min_tile = (int(camerarect.left // camerazoom) - 1, int(camerarect.top // camerazoom) - 1)
+        max_tile = (int(camerarect.right // camerazoom) + 1, int(camerarect.bottom // camerazoom) + 1)
+        for entity in grid.get_entities_in_rect(min_tile, max_tile):
+            if entity in self._static_entities:
+                continue
+            if self.parent.world.has_component(entity, c.Render):
+                pos = self.parent.world.entity_component(entity, c.TilePosition)
+                pixelpos = self.parent.camera.tile_to_pixel_pos(pos.x, pos.y)
                 pixelpos = (pixelpos[0] - camerarect.x, pixelpos[1] - camerarect.y)
                 self.parent.draw_centered_entity(screen, entity, camerascale, pixelpos)
 
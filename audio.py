@@ -3,43 +3,222 @@ Handles sound storing and playing.
 '''
 
 import glob
-import random
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import pygame
 
+import asset_bundle
 import constants
+import random_streams
+
+AUDIO_EXTENSIONS = (".wav", ".ogg")
 
 # Initialising audio
-CACHE = {}
+# Decoded Sound objects, least recently used first. Sounds in constants.PINNED_SOUNDS are never evicted.
+CACHE = OrderedDict()
+BUNDLE = None
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_decoder = None
+_paths = None
+_pending = {} # Sounds being decoded in the background, and how to play them once they are
+_queued = {} # Sounds to play at the next update, with the volumes they were played at
+_voices = {} # (channel, sound) pairs of the channels each sound is playing on, oldest first
+
+def load_bundle():
+    '''Open the bundle of audio files, packing it first if it is out of date.'''
+    global BUNDLE
+    if BUNDLE is None:
+        BUNDLE = asset_bundle.load("audio", constants.AUDIO, AUDIO_EXTENSIONS)
+
+def _sound_paths():
+    '''Return a dictionary of sound names to audio files, used if there is no bundle.'''
+    global _paths
+    if _paths is None:
+        _paths = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for extension in AUDIO_EXTENSIONS for path in glob.glob(constants.AUDIO+"*"+extension)
+        }
+    return _paths
+
+def sound_names():
+    '''Return the names of every sound.'''
+    if BUNDLE is not None:
+        return BUNDLE.names()
+    return list(_sound_paths())
+
+def has_sound(name):
+    '''Return True if there is a sound with a name.'''
+    if BUNDLE is not None:
+        return name in BUNDLE
+    return name in _sound_paths()
 
 def load_audio():
-    '''Initialise the cache of Sound objects.'''
-    for name in glob.glob(constants.AUDIO+"*.wav"):
-        add_to_cache(name)
-    for name in glob.glob(constants.AUDIO+"*.ogg"):
-        add_to_cache(name)
+    '''Decode every sound, as far as the cache's memory budget allows.'''
+    load_bundle()
+    for name in _preload_order():
+        add_to_cache(name, evict=False)
+
+def preload(preloader):
+    '''Decode every sound in the background on a Preloader's threads, as far as the cache's memory budget allows.
+
+    Sounds which don't fit are decoded when they are first played.
+    '''
+    load_bundle()
+    for name in _preload_order():
+        preloader.submit(add_to_cache, name, None, False)
+
+def _preload_order():
+    '''Return the names of every sound, pinned sounds first, so that they are the ones that fit in the cache.'''
+    return [*constants.PINNED_SOUNDS, *(name for name in sound_names() if name not in constants.PINNED_SOUNDS)]
+
+def sound_bytes(sound):
+    '''Return how much memory a decoded sound takes up.'''
+    frequency, size, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * frequency) * channels * abs(size) // 8
+
+def decode(name):
+    '''Return a new Sound decoded from the audio bundle, or its file if there is no bundle.'''
+    if BUNDLE is not None:
+        return pygame.mixer.Sound(file=io.BytesIO(BUNDLE.get_bytes(name)))
+    return pygame.mixer.Sound(_sound_paths()[name])
+
+def add_to_cache(name, sound=None, evict=True):
+    '''Add a sound to the cache, decoding it if it isn't given, and return it.
+
+    The least recently used unpinned sounds are evicted until the cache is within constants.SOUND_CACHE_MAX_BYTES.
+    An unpinned sound bigger than the whole budget isn't cached at all, so it doesn't evict everything else.
+    If evict is False, an unpinned sound is only cached if it fits without evicting any others.
+    Can be called from any thread.
+    '''
+    global _cache_bytes
+    if sound is None:
+        sound = decode(name)
+    if sound_bytes(sound) > constants.SOUND_CACHE_MAX_BYTES and name not in constants.PINNED_SOUNDS:
+        return sound
+    with _cache_lock:
+        if not evict and name not in constants.PINNED_SOUNDS:
+            if _cache_bytes + sound_bytes(sound) > constants.SOUND_CACHE_MAX_BYTES:
+                return sound
+        if name in CACHE:
+            _cache_bytes -= sound_bytes(CACHE.pop(name))
+        CACHE[name] = sound
+        _cache_bytes += sound_bytes(sound)
+        for old_name in [old_name for old_name in CACHE if old_name not in constants.PINNED_SOUNDS]:
+            if _cache_bytes <= constants.SOUND_CACHE_MAX_BYTES or old_name == name:
+                break
+            _cache_bytes -= sound_bytes(CACHE.pop(old_name))
+    return sound
 
-def add_to_cache(filename):
-    '''Add an audio file to the cache of Sound objects.'''
-    cache_name = filename[len(constants.AUDIO):-4]
-    CACHE[cache_name] = pygame.mixer.Sound(filename)
+def _get_cached(name):
+    '''Return a cached sound and mark it as recently used, or return None if it isn't cached.'''
+    with _cache_lock:
+        sound = CACHE.get(name)
+        if sound is not None:
+            CACHE.move_to_end(name)
+    return sound
 
 def play(name, volume=1, replace=False):
-    '''Play an audio sample.
+    '''Queue an audio sample to be played at the next update.
 
+    Plays of the same sound before an update are merged into one play, at their combined volume.
     Using replace will stop all playback of the sound before playing it.
+    Raises a KeyError if there is no sound with the name.
+    '''
+    if not has_sound(name):
+        raise KeyError("No sound named " + repr(name))
+    if name in _queued:
+        volumes, queued_replace = _queued[name]
+        volumes.append(volume)
+        _queued[name] = (volumes, queued_replace or replace)
+    else:
+        _queued[name] = ([volume], replace)
+
+def combined_volume(volumes):
+    '''Return the volume of one play standing in for plays of a sound at each of the volumes.
+
+    Volumes add up like the loudness of unrelated sounds, as the root of the sum of their squares.
+    '''
+    return min(1, math.sqrt(sum(volume*volume for volume in volumes)))
+
+def _play_now(name, volume, replace):
+    '''Play a sound, decoding it first if it hasn't been yet.
+
+    If constants.SOUND_BACKGROUND_DECODING is set, an undecoded sound is decoded on another thread
+    and played by update once it is, even if that makes it late.
+    '''
+    global _decoder
+    sound = _get_cached(name)
+    if sound is None:
+        if not constants.SOUND_BACKGROUND_DECODING:
+            sound = add_to_cache(name)
+        elif name in _pending:
+            return
+        else:
+            if _decoder is None:
+                _decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
+            _pending[name] = (_decoder.submit(add_to_cache, name), volume, replace)
+            return
+    _start(name, sound, volume, replace)
+
+def _priority(name):
+    '''Return the priority of a sound, where sounds with higher priorities can take channels from lower ones.'''
+    return constants.SOUND_PRIORITIES.get(name, 0)
+
+def _lower_priority_channel(priority):
+    '''Return the channel of the playing sound with the lowest priority under priority, or None if there isn't one.'''
+    lowest = None
+    for name, voices in _voices.items():
+        if _priority(name) < priority and voices and (lowest is None or _priority(name) < _priority(lowest)):
+            lowest = name
+    if lowest is None:
+        return None
+    channel, _ = _voices[lowest].pop(0)
+    return channel
+
+def _start(name, sound, volume, replace):
+    '''Start playing a decoded sound on a channel, within its voice limit.
+
+    If the sound is already playing constants.SOUND_VOICE_LIMITS times, its oldest voice is restarted.
+    If every channel is busy, the channel of a lower priority sound is used, or else the sound isn't played.
     '''
-    sound = CACHE[name]
     if replace:
         sound.stop()
-    channel = sound.play()
-    if channel:
-        channel.set_volume(volume)
+    for voices in _voices.values(): # Forget channels which have finished or been taken by other sounds
+        voices[:] = [(channel, voice_sound) for channel, voice_sound in voices if channel.get_sound() is voice_sound]
+    voices = _voices.setdefault(name, [])
+
+    if len(voices) >= constants.SOUND_VOICE_LIMITS.get(name, constants.SOUND_DEFAULT_VOICES):
+        channel, _ = voices.pop(0)
+    else:
+        channel = pygame.mixer.find_channel() or _lower_priority_channel(_priority(name))
+    if channel is None:
+        return
+    channel.play(sound)
+    channel.set_volume(volume)
+    voices.append((channel, sound))
+
+def update():
+    '''Play the sounds queued since the last update, and sounds which have been decoded in the background.'''
+    for name, (future, volume, replace) in list(_pending.items()):
+        if not future.done():
+            continue
+        del _pending[name]
+        _start(name, future.result(), volume, replace)
+
+    for name, (volumes, replace) in _queued.items():
+        _play_now(name, combined_volume(volumes), replace)
+    _queued.clear()
 
 def play_music(music_path=None):
     '''Loop a random piece of music.'''
     if music_path is None:
-        music_path = random.choice(glob.glob(constants.MUSIC+"*"))
+        music_path = random_streams.stream("music").choice(glob.glob(constants.MUSIC+"*"))
     pygame.mixer.music.load(music_path)
     pygame.mixer.music.set_volume(constants.MUSIC_NORMAL_VOLUME)
     pygame.mixer.music.play(-1)
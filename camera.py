@@ -1,9 +1,8 @@
 """Contains the Camera class."""
-import random
-
 import pygame
 
 import constants
+import random_streams
 from misc import DynamicPos
 
 
@@ -28,8 +27,9 @@ class Camera:
 
         Rect position and size is in pixels.
         """
-        x = (self._pos.x + random.uniform(-self._shake_x, self._shake_x)) * self._ppt / constants.TILE_SIZE
-        y = (self._pos.y + random.uniform(-self._shake_y, self._shake_y)) * self._ppt / constants.TILE_SIZE
+        rng = random_streams.stream("camera")
+        x = (self._pos.x + rng.uniform(-self._shake_x, self._shake_x)) * self._ppt / constants.TILE_SIZE
+        y = (self._pos.y + rng.uniform(-self._shake_y, self._shake_y)) * self._ppt / constants.TILE_SIZE
         rect = pygame.Rect((0, 0), self._rect_size)
         rect.center = (x, y)
         return rect
@@ -76,10 +76,11 @@ class Camera:
         self._pos.update(t_frame)
 
         self._t_lastshake += t_frame
+        rng = random_streams.stream("camera")
         while self._t_lastshake >= 1000/30:
             self._t_lastshake -= 1000/30
-            self._shake_x = random.uniform(-self._shake, self._shake)
-            self._shake_y = random.uniform(-self._shake, self._shake)
+            self._shake_x = rng.uniform(-self._shake, self._shake)
+            self._shake_y = rng.uniform(-self._shake, self._shake)
 
             self._shake *= 0.75
             if self._shake < 0.1:
@@ -1,10 +1,11 @@
 """Contains all the ECS Components."""
 
-from random import randint
 from typing import List, Dict
 
 from dataclasses import dataclass, field
 
+import random_streams
+
 @dataclass
 class Boss:
     """Tags an entity as a boss, and contains a list of minions to kill if it dies."""
@@ -49,7 +50,7 @@ class Initiative:
     speed: int
     nextturn: int = field(init=False)
     def __post_init__(self):
-        self.nextturn = randint(2, self.speed+1)
+        self.nextturn = random_streams.stream("initiative").randint(2, self.speed+1)
 
 @dataclass
 class AI:
@@ -9,6 +9,10 @@ DEFAULT_SETTINGS = {
     "fullscreen_mode": True,
     "width": 1200,
     "height": 800,
+    "sprite_cache_mb": 128,
+    "fps_cap": 60,
+    "vsync": False,
+    "fixed_timestep": True,
     # "MUSIC_VOLUME": 0.5,
 }
 
@@ -59,3 +63,39 @@ class Config:
     def height(self, value):
         """Set height setting."""
         self.config_dict["height"] = value
+
+    @property
+    def sprite_cache_mb(self):
+        """Get sprite_cache_mb setting, the memory budget of cached sprites in megabytes."""
+        return self.config_dict.get("sprite_cache_mb", DEFAULT_SETTINGS["sprite_cache_mb"])
+    @sprite_cache_mb.setter
+    def sprite_cache_mb(self, value):
+        """Set sprite_cache_mb setting."""
+        self.config_dict["sprite_cache_mb"] = value
+
+    @property
+    def fps_cap(self):
+        """Get fps_cap setting, the most frames drawn per second, or 0 for no limit."""
+        return self.config_dict.get("fps_cap", DEFAULT_SETTINGS["fps_cap"])
+    @fps_cap.setter
+    def fps_cap(self, value):
+        """Set fps_cap setting."""
+        self.config_dict["fps_cap"] = value
+
+    @property
+    def vsync(self):
+        """Get vsync setting, whether to ask for frames to be synced with the display's refresh rate."""
+        return self.config_dict.get("vsync", DEFAULT_SETTINGS["vsync"])
+    @vsync.setter
+    def vsync(self, value):
+        """Set vsync setting."""
+        self.config_dict["vsync"] = value
+
+    @property
+    def fixed_timestep(self):
+        """Get fixed_timestep setting, whether scenes are updated in steps of GameManager.timestep."""
+        return self.config_dict.get("fixed_timestep", DEFAULT_SETTINGS["fixed_timestep"])
+    @fixed_timestep.setter
+    def fixed_timestep(self, value):
+        """Set fixed_timestep setting."""
+        self.config_dict["fixed_timestep"] = value
@@ -19,6 +19,36 @@ MUSIC = os.path.join(AUDIO, "music", "")
 DEFAULT_IMAGES = os.path.join(ASSETS, "images", "")
 # DEFAULT_IMAGES is sort of redundant, would be used if there were texture packs
 CONFIG_PATH = os.path.join(PATH, "config.cfg")
+# Caches go in the user's cache directory, as PATH is a temporary directory in frozen builds
+if sys.platform == "win32":
+    CACHE = os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "Gim", "cache", "")
+elif sys.platform == "darwin":
+    CACHE = os.path.join(os.path.expanduser("~"), "Library", "Caches", "Gim", "")
+else:
+    CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "gim", "")
+LEVEL_CACHE = os.path.join(CACHE, "levels", "")
+ATLAS_CACHE = os.path.join(CACHE, "atlas", "")
+ASSET_BUNDLE_CACHE = os.path.join(CACHE, "bundles", "")
+
+LEVEL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+IDLE_FRAME_WAIT = 10 # Milliseconds to wait for when nothing on screen has changed
+LEVEL_SNAPSHOT_MEMORY_BYTES = 4 * 1024 * 1024
+SPRITE_CACHE_MAX_ENTRIES = 4096
+FLOOR_CHUNK_PIXELS = 512 # Floor chunks are as many tiles wide as fit in this
+SPRITE_PYRAMID_SCALES = (0.5, 1, 2, 4)
+SPRITE_SCALING_BUDGET = 0.002 # Seconds per frame
+FLOOR_CACHE_MAX_BYTES = 32 * 1024 * 1024
+FIXED_TIMESTEP = 1000/60 # Milliseconds per scene update when fps_cap is 0
+MAX_UPDATES_PER_FRAME = 8 # Any more time behind than this is dropped
+PRELOAD_WORKERS = 4
+LEVEL_STAGING_BUDGET = 0.003 # Seconds per frame
+LEVEL_BUILD_BATCH = 50 # Entities created or snapshotted between checks of the staging budget
+SOUND_CACHE_MAX_BYTES = 8 * 1024 * 1024 # Of decoded sounds
+PINNED_SOUNDS = ("punch", "ow", "explosion") # Always kept decoded
+SOUND_BACKGROUND_DECODING = True
+SOUND_DEFAULT_VOICES = 2 # Most channels a sound can play on at once
+SOUND_VOICE_LIMITS = {"explosion": 3}
+SOUND_PRIORITIES = {"explosion": 2, "ow": 1, "punch": 1} # Others are 0
 
 SPECIAL_CHARS = {":": "col", "-": "dash", ".": "dot",
                  "!": "exc", "/": "fwdslash", "?": "que",
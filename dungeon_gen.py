@@ -1,9 +1,9 @@
 """Contains functions for generating dungeon layout."""
 
-import random
 from dataclasses import dataclass, field
 
 import constants
+import random_streams
 
 
 def default_connections():
@@ -35,36 +35,73 @@ class DungeonNetwork:
     }
     def __init__(self):
         self.__nodes = []
+        self.__node_positions = {}
+        self.__explorable_positions = set()
         self.player_node = None
 
     def add_node(self, node):
-        """Add a node to the list of nodes in the network."""
+        """Add a node to the list of nodes in the network.
+
+        A node with the "start" property can be explored straight away.
+        """
         self.__nodes.append(node)
+        self.__node_positions[node.pos] = node
+        if "start" in node.properties:
+            self.__set_explorable(node)
 
     def get_node_at(self, pos):
         """Get a node which is at a certain position, or None if there is not one there."""
-        pos = tuple(pos)
-        for node in self.__nodes:
-            if node.pos == pos:
-                return node
-        return None
+        return self.__node_positions.get(tuple(pos))
 
     def get_nodes(self):
         """Return a list of all the nodes."""
         return self.__nodes
 
+    def get_nodes_in_rect(self, min_pos, max_pos):
+        """Return a list of the nodes with positions between min_pos and max_pos inclusive."""
+        if (max_pos[0]-min_pos[0]+1) * (max_pos[1]-min_pos[1]+1) > len(self.__nodes):
+            return [node for node in self.__nodes if all(min_pos[i] <= node.pos[i] <= max_pos[i] for i in range(2))]
+        nodes = []
+        for x in range(min_pos[0], max_pos[0]+1):
+            for y in range(min_pos[1], max_pos[1]+1):
+                if (x, y) in self.__node_positions:
+                    nodes.append(self.__node_positions[(x, y)])
+        return nodes
+
+    def get_explorable_nodes(self):
+        """Return a list of nodes which can be explored.
+
+        A node which can be explored has not been explored yet
+        but is next to one which has been, or is the start node.
+        """
+        return [self.__node_positions[pos] for pos in self.__explorable_positions]
+
+    def __set_explorable(self, node):
+        """Mark a node as able to be explored."""
+        node.can_be_explored = True
+        self.__explorable_positions.add(node.pos)
+
+    def explore(self, node):
+        """Mark a node as explored, making the unexplored nodes connected to it explorable."""
+        node.explored = True
+        node.can_be_explored = False
+        self.__explorable_positions.discard(node.pos)
+        for adj_node in node.connections.values():
+            if adj_node is not None and not adj_node.explored:
+                self.__set_explorable(adj_node)
+
     def connect(self, node, direction):
         """Connect a node to whatever is in a direction.
 
         Don't do anything if there is nothing to connect to.
         """
-        other_pos = (node.pos[i] + direction[i] for i in range(2))
+        other_pos = (node.pos[0] + direction[0], node.pos[1] + direction[1])
         other_node = self.get_node_at(other_pos)
         if other_node is not None:
             node.connections[direction] = other_node
             other_node.connections[self.opposite[direction]] = node
 
-def __get_path_direction(x, distance):
+def __get_path_direction(rng, x, distance):
     """Return the direction a path should travel. Return None if not possible."""
     min_x = -1
     max_x = 5
@@ -75,7 +112,7 @@ def __get_path_direction(x, distance):
     if x + distance > max_x:
         can_go_right = False
     if can_go_left and can_go_right:
-        return random.choice([constants.LEFT, constants.RIGHT])
+        return rng.choice([constants.LEFT, constants.RIGHT])
     elif can_go_right:
         return constants.RIGHT
     elif can_go_left:
@@ -89,20 +126,20 @@ def __make_node_and_connect_from(network, x, y, direction):
     network.add_node(node)
     network.connect(node, network.opposite[direction])
 
-def __generate_main_path(network):
+def __generate_main_path(rng, network):
     """Make the random path connecting the start to the end of the dungeon."""
     x = 0
     y = 0
     path_height = 5
     path_length = 7
     for height in range(path_height-1, -1, -1):
-        distance = random.randint(path_length//(1+height), path_length//(1+height*0.5))
-        direction = __get_path_direction(x, distance)
+        distance = rng.randint(path_length//(1+height), path_length//(1+height*0.5))
+        direction = __get_path_direction(rng, x, distance)
         attempts = 0
         while direction is None:
             attempts += 1
-            distance = random.randint(max(0, path_length//(1+height) - attempts), distance-1)
-            direction = __get_path_direction(x, distance)
+            distance = rng.randint(max(0, path_length//(1+height) - attempts), distance-1)
+            direction = __get_path_direction(rng, x, distance)
         path_length -= distance
 
         for _ in range(distance):
@@ -113,7 +150,7 @@ def __generate_main_path(network):
         __make_node_and_connect_from(network, x, y, constants.DOWN)
     network.get_node_at((x, y)).properties.append("boss")
 
-def __add_random_rooms(network, amount, depth):
+def __add_random_rooms(rng, network, amount, depth):
     """Add random rooms coming off of the rooms already placed.
 
     amount is amount of attempted room additions to do on the current rooms.
@@ -122,18 +159,18 @@ def __add_random_rooms(network, amount, depth):
     Low amount, high depth: fewer but longer extra paths.
     """
     for _ in range(depth):
-        for node in random.choices(network.get_nodes(), k=amount):
-            direction = random.choice(constants.DIRECTIONS)
+        for node in rng.choices(network.get_nodes(), k=amount):
+            direction = rng.choice(constants.DIRECTIONS)
             pos = tuple(node.pos[i]+direction[i] for i in range(2))
             if network.get_node_at(pos) is None and -1 <= pos[0] <= 4 and 0 <= pos[1] <= 5:
                 network.add_node(LevelNode(pos))
                 network.connect(node, direction)
 
-def __add_random_connections(network, chance):
+def __add_random_connections(rng, network, chance):
     """Add random connections, which chance being the chance per connection."""
     for node in network.get_nodes():
         for direction in (constants.LEFT, constants.DOWN): # So node chances aren't repeated
-            if random.random() < chance:
+            if rng.random() < chance:
                 network.connect(node, direction)
 
 def __add_elemental_effect(node, element_type):
@@ -144,18 +181,23 @@ def __add_elemental_effect(node, element_type):
     if not "start" in node.properties and not "boss" in node.properties:
         node.properties.append(element_type)
 
-def generate_dungeon_layout():
-    """Return a DungeonNetwork object containing the layout of the dungeon."""
+def generate_dungeon_layout(rng=None):
+    """Return a DungeonNetwork object containing the layout of the dungeon.
+
+    rng is the random.Random object to draw from, by default the dungeon layout stream.
+    """
+    if rng is None:
+        rng = random_streams.stream("dungeon_layout")
     network = DungeonNetwork()
     node = LevelNode((0, 0), properties=["start"])
     network.add_node(node)
     network.player_node = node
 
-    __generate_main_path(network)
-    __add_random_rooms(network, 3, 5)
-    __add_random_connections(network, 0.15)
+    __generate_main_path(rng, network)
+    __add_random_rooms(rng, network, 3, 5)
+    __add_random_connections(rng, network, 0.15)
     # Add random fire sections
-    for node in random.choices(network.get_nodes(), k=2):
+    for node in rng.choices(network.get_nodes(), k=2):
         __add_elemental_effect(node, "fire")
         for _, connected_node in node.connections.items():
             if connected_node is not None:
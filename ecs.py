@@ -2,8 +2,13 @@
 # Shown to be optimised enough, from time analysis. No further optimisation necessary.
 
 
+import itertools
+
 #from functools import lru_cache
 
+# Entity versions are counted across every World, so an Entity moved between Worlds never gets a version it had before
+_versions = itertools.count(1)
+
 def memoize(func):
     """Cache decorator."""
     cache = {}
@@ -58,18 +63,32 @@ class World:
 
     Stores systems and components, as well as tags.
     """
-    def __init__(self):
+    def __init__(self, last_entity_id=0):
         """A World object keeps track of all Entities, Components, and Systems.
 
         A World contains a database of all Entity/Component assignments. It also
         handles calling the process method on any Systems assigned to it.
+        Entity IDs are counted on from last_entity_id, so a World can be made
+        which won't reuse the IDs of another.
         """
         self.tags = TagManager()
         self._systems = []
-        self._next_entity_id = 0
+        self._next_entity_id = last_entity_id
         self._components = {}
         self._entities = {}
+        self._entity_versions = {}
         self._dead_entities = set()
+        self._removal_observers = []
+
+    def add_removal_observer(self, observer):
+        """Call observer(entity) whenever an Entity is deleted or moved out of the World."""
+        self._removal_observers.append(observer)
+
+    def _entities_removed(self, entities):
+        """Tell the removal observers that some Entities have left the World."""
+        for observer in self._removal_observers:
+            for entity in entities:
+                observer(entity)
 
     def clear_cache(self):
         """Not really sure what this one does."""
@@ -83,11 +102,41 @@ class World:
 
     def clear_all(self):
         """Remove all Entities and Components from the World."""
+        removed = tuple(self._entities)
         self._next_entity_id = 0
         self._dead_entities.clear()
         self._components.clear()
         self._entities.clear()
+        self._entity_versions.clear()
+        self.clear_cache()
+        self._entities_removed(removed)
+
+    @property
+    def last_entity_id(self):
+        """The ID of the last Entity created."""
+        return self._next_entity_id
+
+    def move_entities(self, entities, world):
+        """Move Entities and their Components into another World, keeping their IDs.
+
+        Raises a ValueError if one of the IDs is already used in the other World.
+        """
+        for entity in entities:
+            if entity in world._entities:
+                raise ValueError("Entity ID already used in the other World")
+        for entity in entities:
+            components = self._entities.pop(entity)
+            world._entities[entity] = components
+            world.mark_changed(entity)
+            self._entity_versions.pop(entity, None)
+            for component_type in components:
+                self._components[component_type].discard(entity)
+                if not self._components[component_type]:
+                    del self._components[component_type]
+                world._components.setdefault(component_type, set()).add(entity)
+        self._dead_entities.difference_update(entities)
         self.clear_cache()
+        self._entities_removed(entities)
 
     def set_game_reference(self, level):
         """Set the game which the World and systems have a reference to."""
@@ -173,6 +222,8 @@ class World:
 
                 self.remove_cache(component_type)
             del self._entities[entity]
+            self._entity_versions.pop(entity, None)
+            self._entities_removed((entity,))
 
 
 
@@ -245,6 +296,7 @@ class World:
             self._entities[entity] = {}
 
         self._entities[entity][component_type] = component_instance
+        self._entity_versions[entity] = next(_versions)
         self.remove_cache(component_type)
 
     def remove_component(self, entity, component_type):
@@ -268,10 +320,22 @@ class World:
 
         if not self._entities[entity]:
             del self._entities[entity]
+            self._entity_versions.pop(entity, None)
+            self._entities_removed((entity,))
+        else:
+            self._entity_versions[entity] = next(_versions)
 
         self.remove_cache(component_type)
         return entity
 
+    def mark_changed(self, entity):
+        """Mark that a Component of an Entity has been changed in place, so anything cached about the Entity is out of date."""
+        self._entity_versions[entity] = next(_versions)
+
+    def entity_version(self, entity):
+        """Return a number which changes whenever an Entity's Components are added, removed or marked as changed."""
+        return self._entity_versions.get(entity, 0)
+
     def _get_component(self, component_type):
         """Get an iterator for Entity, Component pairs.
 
@@ -344,7 +408,9 @@ class World:
                     del self._components[component_type]
                 self.remove_cache(component_type)
             del self._entities[entity]
+            self._entity_versions.pop(entity, None)
 
+        self._entities_removed(self._dead_entities)
         self._dead_entities.clear()
 
     def _process(self, *args, **kwargs):
@@ -1,9 +1,8 @@
 """Stores templates for entity components."""
 
-from random import choice
-
 import animations
 import components as c
+import random_streams
 
 
 def item(**args):
@@ -293,7 +292,7 @@ def edward(x, y):
 def wall(x, y):
     """Wall components."""
     return [
-        c.Render(choice(("wall1", "wall2"))),
+        c.Render(random_streams.stream("templates").choice(("wall1", "wall2"))),
         c.TilePosition(x, y),
         c.Blocker(),
         c.Destructible(),
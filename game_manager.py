@@ -1,8 +1,17 @@
 """Contains the GameManager class."""
 
+from concurrent.futures import ProcessPoolExecutor
+
 import pygame
 
+import audio
+import config
+import constants
 import renderer
+from preloader import Preloader
+
+# If more areas than this are dirty, their union is redrawn instead
+MAX_DIRTY_RECTS = 8
 
 
 class GameManager:
@@ -11,22 +20,73 @@ class GameManager:
     Stores global objects as well as the scene tree.
     """
     def __init__(self, width, height):
-        self.renderer = renderer.Renderer()
+        self.config = config.Config()
+        self.renderer = renderer.Renderer(self.config.sprite_cache_mb * 1024 * 1024)
+        self.preloader = Preloader(constants.PRELOAD_WORKERS)
         self.clock = pygame.time.Clock()
         self.width = width
         self.height = height
 
         self.t_elapsed = 0
         self.fps = 0
+        self._update_time = 0
+        self._new_scenes = False
 
         self.base_scene = None
         self._focus_scene_stack = []
 
+        self._worker_pool = None
+        self._redraw_all = True
+
+    @property
+    def worker_pool(self):
+        """Get the process pool used for background work such as level generation.
+
+        The pool is only started the first time it is used.
+        """
+        if self._worker_pool is None:
+            self._worker_pool = ProcessPoolExecutor(max_workers=1)
+        return self._worker_pool
+
+    def shutdown(self):
+        """Stop the background workers without waiting for them, cancelling any work they haven't started.
+
+        Called before the game exits.
+        """
+        if self._worker_pool is not None:
+            processes = list(self._worker_pool._processes.values())
+            self._worker_pool.shutdown(wait=False, cancel_futures=True)
+            # Otherwise the interpreter waits for a running level generation before exiting.
+            # They are killed rather than terminated since they inherit SDL's handler for SIGTERM,
+            # which is safe since levels are only written to the level cache once they are complete.
+            for process in processes:
+                process.kill()
+            self._worker_pool = None
+        if self.preloader is not None:
+            self.preloader.shutdown()
+            self.preloader = None
+
+    @property
+    def timestep(self):
+        """Get the milliseconds per scene update when config.fixed_timestep is set.
+
+        This is the frame time at config.fps_cap, so scenes are updated once per frame,
+        or constants.FIXED_TIMESTEP if frames aren't capped.
+        """
+        if self.config.fps_cap:
+            return 1000 / self.config.fps_cap
+        return constants.FIXED_TIMESTEP
+
+    def scene_created(self):
+        """Make sure that the scenes are updated again before they are next drawn. Called when a scene is created."""
+        self._new_scenes = True
+
     def change_base_scene(self, scene_type, *args, **kwargs):
         """Replace the scene tree with a base scene given its type and input parameters. Focus on this scene."""
         if self.base_scene is not None:
             self._remove_base_scene()
         self.base_scene = scene_type(*args, **kwargs, game=self)
+        self._redraw_all = True
         self.set_focus(self.base_scene)
 
     def _remove_base_scene(self):
@@ -47,10 +107,12 @@ class GameManager:
         if scene in self._focus_scene_stack:
             self.remove_focus(scene)
         self._focus_scene_stack.append(scene)
+        self._redraw_all = True
 
     def remove_focus(self, scene):
         """Remove focus from a scene."""
         self._focus_scene_stack.remove(scene)
+        self._redraw_all = True
 
     def remove_scene(self, scene, parent_being_removed=False):
         """Remove a scene from the scene tree."""
@@ -62,6 +124,7 @@ class GameManager:
             self.remove_focus(scene)
         if not parent_being_removed:
             scene.parent.children.remove(scene)
+        self._redraw_all = True
 
     def call_all_scenes(self, event_name, *args, **kwargs):
         """Recursively call a function on all scenes in the scene tree."""
@@ -94,15 +157,71 @@ class GameManager:
             input_handled = self._focus_scene_stack[stack_pos].handle_input(keypress)
 
     def update(self):
-        """Run a tick of the scenes."""
-        delta = self.clock.tick()
+        """Run a tick of the scenes, waiting first so that frames are drawn at most config.fps_cap times per second.
+
+        If config.fixed_timestep is set, the scenes are updated in steps of GameManager.timestep
+        for the time that has passed, so their movement doesn't depend on the frame rate.
+        A step is always run after a scene has been created, so that it is updated before it is drawn.
+        """
+        delta = self.clock.tick(self.config.fps_cap)
         self.t_elapsed += delta
         self.fps = int(self.clock.get_fps())
-        self.call_all_scenes("update", delta)
+        if self.preloader is not None and self.preloader.done: # Preloading is finished
+            self.preloader.wait()
+            self.preloader.shutdown()
+            self.preloader = None
+        if self.config.fixed_timestep:
+            timestep = self.timestep
+            self._update_time = min(self._update_time + delta, timestep * constants.MAX_UPDATES_PER_FRAME)
+            steps = 0
+            # New scenes are updated before they are drawn, running a step early if its time hasn't passed yet
+            while steps < constants.MAX_UPDATES_PER_FRAME and (self._update_time >= timestep or self._new_scenes):
+                self._new_scenes = False
+                self._update_time = max(self._update_time - timestep, 0)
+                steps += 1
+                self.call_all_scenes("update", timestep)
+        else:
+            self.call_all_scenes("update", delta)
+        audio.update() # Sounds played this frame start together
 
     def draw(self, screen):
-        """Draw the whole scene tree, taking into account draw order."""
-        self.__draw_scene(screen, self.base_scene)
+        """Draw the scene tree, taking into account draw order.
+
+        Only the areas of the screen which scenes have marked as dirty are redrawn.
+        The whole screen is redrawn every frame while any scene doesn't track dirty rects. Level and its
+        child scenes and the GameOptions pause menu don't, so only menus and LevelSelect have cheap idle frames.
+        Returns a list of the rects which were redrawn, or None if the whole screen was.
+        """
+        self.renderer.start_frame()
+        dirty_rects = self.__pop_dirty_rects(self.base_scene)
+        if self._redraw_all or dirty_rects is None:
+            self._redraw_all = False
+            screen.fill(constants.BLACK)
+            self.__draw_scene(screen, self.base_scene)
+            self.renderer.end_frame()
+            return None
+
+        screen_rect = screen.get_rect()
+        dirty_rects = [rect.clip(screen_rect) for rect in dirty_rects]
+        dirty_rects = [rect for rect in dirty_rects if rect.width and rect.height]
+        if len(dirty_rects) > MAX_DIRTY_RECTS:
+            dirty_rects = [dirty_rects[0].unionall(dirty_rects[1:])]
+        for rect in dirty_rects:
+            screen.set_clip(rect)
+            screen.fill(constants.BLACK)
+            self.__draw_scene(screen, self.base_scene)
+        screen.set_clip(None)
+        self.renderer.end_frame()
+        return dirty_rects
+
+    def __pop_dirty_rects(self, scene):
+        """Return the dirty rects of a scene and its child scenes, or None if the whole screen is dirty."""
+        dirty_rects = scene.pop_dirty_rects()
+        for child in scene.children:
+            child_rects = self.__pop_dirty_rects(child) # Popped even if already None, so that it is reset
+            if dirty_rects is not None:
+                dirty_rects = None if child_rects is None else dirty_rects + child_rects
+        return dirty_rects
 
     def __draw_scene(self, screen, scene):
         """Draw a scene and its child scenes."""
@@ -0,0 +1,177 @@
+'''
+Headless batch generation of dungeons and levels, for tuning generation.
+
+Generates seeded dungeons and all of their levels across a process pool, then prints
+generation throughput and per-level quality metrics as JSON.
+
+Dungeon seeds are consecutive from --seed, and the layouts match the game's with constants.SEED
+set to that dungeon's seed. Each level is generated with its shortest-path level number. In the
+game, a level's number is how many levels the player has played before it, so a level only
+matches the game's if the player reached it by a shortest path.
+
+# VV Example VV
+# py generate_levels.py --dungeons 200 --seed 1 --output levels.json
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dungeon_gen
+import level_cache
+import level_gen
+import random_streams
+
+# Levels whose walkable area is less reachable than this from the player start are reported as degenerate.
+DEGENERATE_REACHABLE_RATIO = 0.5
+
+def node_level_numbers(network):
+    """Return a dictionary of node positions to shortest-path level numbers.
+
+    The shortest-path level number of a node is the least amount of levels which can be played to reach it,
+    plus one. The game numbers levels by how many the player has actually played, which can be more.
+    """
+    start = network.get_nodes()[0]
+    level_nums = {start.pos: 1}
+    queue = deque((start,))
+    while queue:
+        node = queue.popleft()
+        for connected_node in node.connections.values():
+            if connected_node is not None and connected_node.pos not in level_nums:
+                level_nums[connected_node.pos] = level_nums[node.pos] + 1
+                queue.append(connected_node)
+    return level_nums
+
+def level_metrics(level):
+    """Return a dictionary of quality metrics about a generated Level object."""
+    tiles = level.tiles
+    walkable = tiles != level_gen.WALL
+    reachable = level_gen.reachable_mask(tiles, level.player_start)
+    stairs = tiles == level_gen.STAIRS
+
+    loot_positions = np.argwhere((tiles >= level_gen.HEALTH_POTION) & (tiles <= level_gen.BOMB))
+    if len(loot_positions):
+        loot_spread = float(np.linalg.norm(loot_positions - loot_positions.mean(axis=0), axis=1).mean())
+    else:
+        loot_spread = 0.0
+
+    enemies = Counter(level_gen.CREATURE_TEMPLATES[template] for template in level.creatures[:, 0].tolist())
+
+    return {
+        "open_ratio": float(walkable.mean()),
+        "reachable_ratio": float(reachable.sum() / max(walkable.sum(), 1)),
+        "stairs_reachable": bool((reachable & stairs).any()) if stairs.any() else None,
+        "enemies": dict(enemies),
+        "enemy_count": int(len(level.creatures)),
+        "loot_count": int(len(loot_positions)),
+        "loot_spread": loot_spread,
+    }
+
+def generate_dungeon(dungeon_seed, gridsize, use_cache=False):
+    """Generate a dungeon and all of its levels, returning a list of level results.
+
+    If use_cache is True, levels are loaded from the level cache when possible.
+    Run in worker processes.
+    """
+    layout_seed = random_streams.derive_seed("dungeon_layout", master_seed=dungeon_seed)
+    t_start = time.perf_counter()
+    network = dungeon_gen.generate_dungeon_layout(random.Random(layout_seed))
+    layout_time = time.perf_counter() - t_start
+
+    results = []
+    for pos, level_num in node_level_numbers(network).items():
+        node = network.get_node_at(pos)
+        seed = random_streams.derive_seed("level", node.pos, level_num, master_seed=dungeon_seed)
+        t_start = time.perf_counter()
+        if use_cache:
+            level_type = level_gen.get_level_type(node.properties)
+            key = level_cache.level_key(gridsize, dungeon_seed, node.pos, level_num, level_type)
+            level = level_cache.load_or_generate(key, gridsize, level_num, node.properties, seed)
+        else:
+            level = level_gen.generate_level(gridsize, level_num, node.properties, seed)
+        generation_time = time.perf_counter() - t_start
+        results.append({
+            "dungeon_seed": dungeon_seed,
+            "node": node.pos,
+            "level_num": level_num,
+            "properties": node.properties,
+            "generation_ms": generation_time * 1000,
+            **level.generation_stats,
+            **level_metrics(level)
+        })
+    return {"dungeon_seed": dungeon_seed, "nodes": len(network.get_nodes()), "layout_ms": layout_time * 1000, "levels": results}
+
+def _level_key(level, *keys):
+    """Return the seed and node of a level result, along with some of its values."""
+    return {"dungeon_seed": level["dungeon_seed"], "node": level["node"], **{key: level[key] for key in keys}}
+
+def summarise(dungeons, wall_time):
+    """Return a dictionary summarising the results of all generated dungeons."""
+    levels = [level for dungeon in dungeons for level in dungeon["levels"]]
+    generation_ms = np.array([level["generation_ms"] for level in levels])
+    enemies = Counter()
+    for level in levels:
+        enemies.update(level["enemies"])
+    slowest = sorted(levels, key=lambda level: level["generation_ms"], reverse=True)[:5]
+    degenerate = [
+        level for level in levels
+        if level["reachable_ratio"] < DEGENERATE_REACHABLE_RATIO or level["stairs_reachable"] is False
+    ]
+    return {
+        "dungeons": len(dungeons),
+        "levels": len(levels),
+        "wall_time_s": wall_time,
+        "levels_per_s": len(levels) / wall_time if wall_time else None,
+        "layout_ms_mean": float(np.mean([dungeon["layout_ms"] for dungeon in dungeons])),
+        "generation_ms_mean": float(generation_ms.mean()),
+        "generation_ms_p95": float(np.percentile(generation_ms, 95)),
+        "generation_ms_max": float(generation_ms.max()),
+        "repair_ms_mean": float(np.mean([level.get("repair_ms", 0) for level in levels])),
+        "repair_ms_total": float(np.sum([level.get("repair_ms", 0) for level in levels])),
+        "corridor_tiles_mean": float(np.mean([level.get("corridor_tiles", 0) for level in levels])),
+        "open_ratio_mean": float(np.mean([level["open_ratio"] for level in levels])),
+        "reachable_ratio_mean": float(np.mean([level["reachable_ratio"] for level in levels])),
+        "enemies": dict(enemies),
+        "loot_spread_mean": float(np.mean([level["loot_spread"] for level in levels])),
+        "slowest": [_level_key(level, "generation_ms") for level in slowest],
+        "degenerate": [_level_key(level, "reachable_ratio", "stairs_reachable") for level in degenerate],
+    }
+
+def main():
+    """Parse arguments, generate the dungeons and output the results."""
+    parser = argparse.ArgumentParser(description="Generate seeded dungeons and report level generation stats as JSON.")
+    parser.add_argument("--dungeons", type=int, default=100, help="amount of dungeons to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first dungeon")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="amount of worker processes")
+    parser.add_argument("--gridsize", type=int, nargs=2, default=(30, 30), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--output", help="file to write the JSON to, instead of stdout")
+    parser.add_argument("--summary-only", action="store_true", help="leave out per-level results")
+    parser.add_argument("--cache", action="store_true", help="load levels from the level cache when possible")
+    args = parser.parse_args()
+
+    seeds = range(args.seed, args.seed + args.dungeons)
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        dungeons = list(pool.map(generate_dungeon, seeds, [tuple(args.gridsize)]*len(seeds), [args.cache]*len(seeds), chunksize=4))
+    wall_time = time.perf_counter() - t_start
+
+    results = {"summary": summarise(dungeons, wall_time)}
+    if not args.summary_only:
+        results["dungeons"] = dungeons
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
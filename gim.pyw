@@ -12,8 +12,10 @@ To do:
 # VV Do this to profile VV
 # py -m cProfile -s tottime gim.pyw
 
-import pygame
 import ctypes
+import multiprocessing
+
+import pygame
 
 import audio
 import config as config_api
@@ -25,20 +27,20 @@ from misc import leave
 
 #from functools import lru_cache
 
-ctypes.windll.user32.SetProcessDPIAware() # Fix windows scaling
-pygame.mixer.pre_init(44100, -16, 2, 2048)
-pygame.init()
-
-pygame.mixer.set_num_channels(8)
-
-audio.load_audio()
-
 def main():
     """Run the game."""
 
+    # Initialisation is done here rather than on import, since worker processes import this module too.
+    ctypes.windll.user32.SetProcessDPIAware() # Fix windows scaling
+    pygame.mixer.pre_init(44100, -16, 2, 2048)
+    pygame.init()
+
+    pygame.mixer.set_num_channels(8)
+
     screen, width, height = init_screen()
 
     game = GameManager(width, height)
+    audio.preload(game.preloader) # Sounds are decoded while the main menu title drops
     game.change_base_scene(MainMenu)
 
     while True:
@@ -46,6 +48,7 @@ def main():
         for event in events:
             if event.type == pygame.QUIT:
                 game.save_game()
+                game.shutdown()
                 leave()
             if event.type == pygame.KEYDOWN:
                 keypress = key_input.Keypress(event.key)
@@ -54,9 +57,13 @@ def main():
 
         game.update()
 
-        screen.fill(constants.BLACK)
-        game.draw(screen)
-        pygame.display.update()
+        dirty_rects = game.draw(screen)
+        if dirty_rects is None:
+            pygame.display.update()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
+        else: # Nothing has changed, so wait instead of spinning
+            pygame.time.wait(constants.IDLE_FRAME_WAIT)
 
 def init_screen():
     """Returns the screen surface, as well as width and height constants."""
@@ -69,11 +76,20 @@ def init_screen():
         width = info_object.current_w
         height = info_object.current_h
 
-        screen = pygame.display.set_mode((width, height), pygame.FULLSCREEN | pygame.HWSURFACE | pygame.DOUBLEBUF)
+        flags = pygame.FULLSCREEN | pygame.HWSURFACE | pygame.DOUBLEBUF
     else:
         width = config.width
         height = config.height
-        screen = pygame.display.set_mode((width, height))
+        flags = 0
+
+    screen = None
+    if config.vsync: # Vsync needs the display to be drawn with a renderer, which may not be available
+        try:
+            screen = pygame.display.set_mode((width, height), flags | pygame.SCALED, vsync=1)
+        except pygame.error:
+            pass
+    if screen is None:
+        screen = pygame.display.set_mode((width, height), flags)
 
     constants.MENU_SCALE = round(width/600)
 
@@ -82,4 +98,5 @@ def init_screen():
     return screen, width, height
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Lets worker processes start from the executable
     main()
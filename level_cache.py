@@ -0,0 +1,112 @@
+'''
+Stores generated level descriptions on disk so they don't have to be generated again.
+
+Levels are content-addressed by a key of everything that decides what is generated.
+Cached levels are memory-mapped when loaded, and the least recently used levels are
+deleted once the cache is larger than constants.LEVEL_CACHE_MAX_BYTES.
+Each process keeps track of the cache's size itself, so the directory is only
+scanned when the cache is first written to and when levels have to be evicted.
+'''
+
+import hashlib
+import mmap
+import os
+
+import constants
+import level_gen
+
+EXTENSION = ".level"
+
+_cache_bytes = None # The size of the cache as far as this process knows, or None before it is first scanned
+
+def level_key(gridsize, master_seed, pos, levelnum, level_type):
+    """Return the cache key of a level."""
+    key = (level_gen.GENERATOR_VERSION, master_seed, tuple(pos), levelnum, level_type, tuple(gridsize))
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+def _get_path(key):
+    """Return the path of the cache file for a key."""
+    return os.path.join(constants.LEVEL_CACHE, key + EXTENSION)
+
+def load(key):
+    """Return a Level object memory-mapped from the cache, or None if it isn't cached."""
+    path = _get_path(key)
+    try:
+        with open(path, 'rb') as level_file:
+            data = mmap.mmap(level_file.fileno(), 0, access=mmap.ACCESS_READ)
+        level = level_gen.Level.from_bytes(data)
+        os.utime(path) # Marks it as recently used
+    except (OSError, ValueError):
+        return None
+    return level
+
+def store(key, level):
+    """Write a Level object to the cache, then evict levels if the cache is too large.
+
+    Raises OSError if the level can't be written.
+    """
+    global _cache_bytes
+    os.makedirs(constants.LEVEL_CACHE, exist_ok=True)
+    path = _get_path(key)
+    temp_path = path + "." + str(os.getpid())
+    data = level.to_bytes()
+    with open(temp_path, 'wb') as level_file:
+        level_file.write(data)
+    os.replace(temp_path, path) # So that a half-written level is never loaded
+    if _cache_bytes is None:
+        _cache_bytes = sum(stat.st_size for stat in _get_stats().values())
+    else:
+        _cache_bytes += len(data)
+    if _cache_bytes > constants.LEVEL_CACHE_MAX_BYTES:
+        evict()
+
+def _get_stats():
+    """Return the stat results of the cached levels by path."""
+    entries = [entry for entry in os.scandir(constants.LEVEL_CACHE) if entry.name.endswith(EXTENSION)]
+    return {entry.path: entry.stat() for entry in entries}
+
+def evict(max_bytes=None):
+    """Delete the least recently used levels until the cache is no larger than max_bytes.
+
+    max_bytes defaults to constants.LEVEL_CACHE_MAX_BYTES.
+    """
+    global _cache_bytes
+    if max_bytes is None:
+        max_bytes = constants.LEVEL_CACHE_MAX_BYTES
+    stats = _get_stats()
+    total = sum(stat.st_size for stat in stats.values()) # Also counts levels other processes have written
+    for path in sorted(stats, key=lambda path: stats[path].st_mtime):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError: # Can happen if the level is memory-mapped on Windows
+            continue
+        total -= stats[path].st_size
+    _cache_bytes = total
+
+def load_or_generate(key, gridsize, levelnum, properties, seed):
+    """Return a Level object from the cache, generating and caching it if it isn't there."""
+    level = load(key)
+    if level is None:
+        level = level_gen.generate_level(gridsize, levelnum, properties, seed)
+        try:
+            store(key, level)
+        except OSError:
+            pass
+    return level
+
+def cache_level(key, gridsize, levelnum, properties, seed):
+    """Make sure a level is in the cache.
+
+    Returns None if the level is cached, otherwise returns its description as bytes.
+    Used to generate levels in a worker process.
+    """
+    if os.path.exists(_get_path(key)):
+        return None
+    level = level_gen.generate_level(gridsize, levelnum, properties, seed)
+    try:
+        store(key, level)
+    except OSError:
+        return level.to_bytes()
+    return None
@@ -1,53 +1,218 @@
-"""Contains functions for generating levels."""
+"""Contains functions for generating levels.
 
-import random
+Levels are generated as integer tile arrays indexed by [x, y], and only turned
+into entity components once, when the level is created in the ECS.
+"""
 
-from pygame import Rect
+import time
+
+import numpy as np
 
 import entity_templates
+import random_streams
 from components import FireElement, IceElement
 
+# Increase this whenever a change to generation means the same seed makes a different level.
+GENERATOR_VERSION = 1
 
-class Level:
-    """Contains data about a level which can be used to create it."""
-    def __init__(self, player_start=None):
-        self.player_start = player_start
-        self.entities = []
+# Tile types. The index of a tile type is its value in a tile array.
+FLOOR = 0
+WALL = 1
+STAIRS = 2
+HEALTH_POTION = 3
+SPEED_POTION = 4
+TELEPORT_POTION = 5
+BOMB = 6
+
+TILE_TEMPLATES = (None, "wall", "stairs", "health_potion", "speed_potion", "teleport_potion", "bomb")
+LOOT = np.array((HEALTH_POTION, SPEED_POTION, TELEPORT_POTION, BOMB), dtype=np.uint8)
+
+CREATURE_TEMPLATES = ("snake", "ogre", "slime_medium", "slime_large", "bomb_goblin", "caterkiller", "golem", "fly", "fly_wizard")
+
+# Element types, stored per tile and per creature.
+NO_ELEMENT = 0
+FIRE = 1
+ICE = 2
 
-class Grid:
-    """A grid of cells which each contain a list of strings corresponding to entities."""
-    def __init__(self, gridsize):
-        self.gridsize = gridsize
+ELEMENT_COMPONENTS = (None, FireElement, IceElement)
+LEVEL_TYPE_ELEMENTS = {"fire": FIRE, "ice": ICE}
 
-        self.grid = []
-        for x in range(0, self.width):  # Walls
-            self.grid.append([])
-            for _ in range(0, self.height):
-                self.grid[x].append([])
+# Room carving is redone if less than this ratio of the level is open, up to a maximum amount of attempts.
+# The budget is in attempts rather than time so that generation stays reproducible.
+MIN_OPEN_RATIO = 0.2
+MAX_CARVE_ATTEMPTS = 5
+
+
+class Level:
+    """Contains data about a level which can be used to create it.
+
+    tiles and elements are arrays of tile types and element types indexed by [x, y].
+    creatures is an array of (creature template, x, y, element) rows.
+    """
+    def __init__(self, gridsize, player_start=None):
+        self.player_start = player_start
+        self.tiles = np.full(gridsize, FLOOR, dtype=np.uint8)
+        self.elements = np.zeros(gridsize, dtype=np.uint8)
+        self.creatures = np.zeros((0, 4), dtype=np.int32)
+        self.generation_stats = {}
 
     @property
     def width(self):
-        """Return width of grid array."""
-        return self.gridsize[0]
+        """Return width of the tile array."""
+        return self.tiles.shape[0]
 
     @property
     def height(self):
-        """Return height of grid array."""
-        return self.gridsize[1]
-
-    def __getitem__(self, x):
-        """Return a column from the grid."""
-        return self.grid[x]
-
-    def __iter__(self):
-        """Return an iterable which iterates through the grid."""
-        for x in range(self.width):
-            for y in range(self.height):
-                yield (x, y, self.grid[x][y])
-
-def __random_loot():
-    """Return the name of a random peice of loot."""
-    return random.choice(("health_potion", "speed_potion", "teleport_potion", "bomb"))
+        """Return height of the tile array."""
+        return self.tiles.shape[1]
+
+    def to_bytes(self):
+        """Return a compact description of the level as bytes.
+
+        The description is a header of (width, height, player start x, player start y, creature count)
+        followed by the raw tile, element and creature arrays.
+        """
+        header = np.array((self.width, self.height, *self.player_start, len(self.creatures)), dtype=np.int32)
+        return b"".join((header.tobytes(), self.tiles.tobytes(), self.elements.tobytes(), self.creatures.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return a Level object from a description made by to_bytes.
+
+        The arrays of the returned level are read-only views of data.
+        """
+        width, height, start_x, start_y, creature_count = np.frombuffer(data, dtype=np.int32, count=5).tolist()
+        level = cls((width, height), (start_x, start_y))
+        offset = 5*4
+        level.tiles = np.frombuffer(data, dtype=np.uint8, count=width*height, offset=offset).reshape(width, height)
+        offset += width*height
+        level.elements = np.frombuffer(data, dtype=np.uint8, count=width*height, offset=offset).reshape(width, height)
+        offset += width*height
+        level.creatures = np.frombuffer(data, dtype=np.int32, count=creature_count*4, offset=offset).reshape(-1, 4)
+        return level
+
+    def add_creatures(self, creatures):
+        """Add rows of (creature template, x, y, element) to the level."""
+        creatures = np.asarray(creatures, dtype=np.int32).reshape(-1, 4)
+        self.creatures = np.concatenate((self.creatures, creatures))
+
+    def create_entities(self):
+        """Return a list of component lists for every entity in the level."""
+        entities = []
+        xs, ys = np.nonzero(self.tiles)
+        tile_rows = zip(self.tiles[xs, ys].tolist(), xs.tolist(), ys.tolist(), self.elements[xs, ys].tolist())
+        for names, rows in ((TILE_TEMPLATES, tile_rows), (CREATURE_TEMPLATES, self.creatures.tolist())):
+            templates = [getattr(entity_templates, name) if name else None for name in names]
+            for template, x, y, element in rows:
+                components = templates[template](x, y)
+                if element:
+                    components.append(ELEMENT_COMPONENTS[element]())
+                entities.append(components)
+        return entities
+
+
+def reachable_mask(tiles, start):
+    """Return a boolean array of the tiles which can be walked to from a start position.
+
+    Any tile other than a wall can be walked on, and movement is orthogonal.
+    """
+    walkable = tiles != WALL
+    reached = np.zeros(tiles.shape, dtype=bool)
+    reached[start] = walkable[start]
+    frontier = reached.copy()
+    while frontier.any():
+        grown = np.zeros(tiles.shape, dtype=bool)
+        grown[1:] |= frontier[:-1]
+        grown[:-1] |= frontier[1:]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & walkable & ~reached
+        reached |= frontier
+    return reached
+
+def label_regions(walkable):
+    """Label each orthogonally connected region of walkable tiles.
+
+    Returns an array of region labels, with -1 for tiles which are not walkable, and the amount of regions.
+    Regions are found by repeatedly hooking neighbouring trees of tiles together and flattening them.
+    """
+    indices = np.arange(walkable.size).reshape(walkable.shape)
+    horizontal = walkable[:-1] & walkable[1:]
+    vertical = walkable[:, :-1] & walkable[:, 1:]
+    edge_a = np.concatenate((indices[:-1][horizontal], indices[:, :-1][vertical]))
+    edge_b = np.concatenate((indices[1:][horizontal], indices[:, 1:][vertical]))
+
+    parent = np.arange(walkable.size)
+    while True:
+        root_a, root_b = parent[edge_a], parent[edge_b]
+        unjoined = root_a != root_b
+        if not unjoined.any():
+            break
+        np.minimum.at(parent, np.maximum(root_a, root_b)[unjoined], np.minimum(root_a, root_b)[unjoined])
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    labels = np.full(walkable.shape, -1)
+    roots, labels[walkable] = np.unique(parent.reshape(walkable.shape)[walkable], return_inverse=True)
+    return labels, len(roots)
+
+def _carve_line(line):
+    """Turn the walls in a line of tiles into floor, returning how many were carved."""
+    walls = line == WALL
+    line[walls] = FLOOR
+    return int(walls.sum())
+
+def connect_regions(tiles):
+    """Carve corridors through walls until every walkable tile is connected.
+
+    Each region is joined to the region with the nearest centre using an L-shaped corridor,
+    so the amount of regions at least halves every pass.
+    Returns the amount of regions there were and the amount of wall tiles carved.
+    """
+    labels, region_count = label_regions(tiles != WALL)
+    initial_regions = region_count
+    carved = 0
+    while region_count > 1:
+        walkable_tiles = np.argwhere(labels >= 0)
+        tile_labels = labels[labels >= 0]
+        order = np.argsort(tile_labels, kind="stable")
+        sizes = np.bincount(tile_labels, minlength=region_count)
+        region_tiles = np.split(walkable_tiles[order], np.cumsum(sizes)[:-1])
+        centers = np.array([region.mean(axis=0) for region in region_tiles])
+
+        distances = np.abs(centers[:, None] - centers[None]).sum(axis=2)
+        np.fill_diagonal(distances, np.inf)
+        nearest = distances.argmin(axis=1)
+
+        for region, other in enumerate(nearest.tolist()):
+            if nearest[other] == region and other < region: # Already joined from the other side
+                continue
+            start = region_tiles[region][np.abs(region_tiles[region] - centers[other]).sum(axis=1).argmin()]
+            end = region_tiles[other][np.abs(region_tiles[other] - start).sum(axis=1).argmin()]
+            x_min, x_max = sorted((start[0], end[0]))
+            y_min, y_max = sorted((start[1], end[1]))
+            carved += _carve_line(tiles[x_min:x_max+1, start[1]])
+            carved += _carve_line(tiles[end[0], y_min:y_max+1])
+
+        labels, region_count = label_regions(tiles != WALL)
+    return initial_regions, carved
+
+def _random_tile(rng, mask, amount=None):
+    """Return random (x, y) positions where mask is True, without repeats.
+
+    Returns a single position if amount is None, otherwise an array of up to amount positions.
+    If mask has no True values, positions are picked from the whole array instead.
+    """
+    indices = np.flatnonzero(mask)
+    if not indices.size:
+        indices = np.arange(mask.size)
+    if amount is None:
+        return np.unravel_index(rng.choice(indices), mask.shape)
+    chosen = rng.choice(indices, min(amount, indices.size), replace=False)
+    return np.stack(np.unravel_index(chosen, mask.shape), axis=1)
 
 def __generate_spawn_pool(levelnum):
     """Return a list of creatures which can spawn on a level."""
@@ -68,121 +233,121 @@ def __generate_spawn_pool(levelnum):
         spawn_pool.extend(["golem"]*1)
     return spawn_pool
 
-def __random_empty_pos(grid):
-    x = random.randrange(grid.width)
-    y = random.randrange(grid.height)
-    while grid[x][y]:
-        x = random.randrange(grid.width)
-        y = random.randrange(grid.height)
-    return (x, y)
-
-def __random_enemy_spawn(level, grid):
-    x = random.randrange(grid.width)
-    y = random.randrange(grid.height)
-    while "wall" in grid[x][y] or "stairs" in grid[x][y] or "enemy" in grid[x][y] or (x, y) == level.player_start:
-        x = random.randrange(grid.width)
-        y = random.randrange(grid.height)
-    return (x, y)
-
-def __add_grid_to_level(level, grid, level_type=None):
-    """Add a grid to the list of entities in a Level object."""
-    for x, y, cell in grid:
-        for entity_string in cell:
-            entity = getattr(entity_templates, entity_string)(x, y)
-            if entity_string == "wall":
-                if random.randint(1, 3) == 1:
-                    if level_type == "ice":
-                        entity.append(IceElement())
-                    if level_type == "fire":
-                        entity.append(FireElement())
-            level.entities.append(entity)
-
-def __add_random_enemies_to_level(level, grid, levelnum, level_type=None):
+def __carve_rooms(rng, tiles):
+    """Carve random rooms of floor into the tile array.
+
+    Every tile has a chance of being the top-left corner of a room which fits on the grid.
+    Rooms are summed into a coverage array using corner differences, so all rooms are carved at once.
+    """
+    width, height = tiles.shape
+    xs, ys = np.indices(tiles.shape)
+    room_widths = rng.integers(2, 7, tiles.shape)
+    room_heights = rng.integers(2, 7, tiles.shape)
+    rooms = (xs + room_widths <= width) & (ys + room_heights <= height) & (rng.integers(0, 15, tiles.shape) == 0)
+
+    xs, ys = xs[rooms], ys[rooms]
+    room_widths, room_heights = room_widths[rooms], room_heights[rooms]
+    coverage = np.zeros((width+1, height+1), dtype=np.int32)
+    np.add.at(coverage, (xs, ys), 1)
+    np.add.at(coverage, (xs+room_widths, ys), -1)
+    np.add.at(coverage, (xs, ys+room_heights), -1)
+    np.add.at(coverage, (xs+room_widths, ys+room_heights), 1)
+    coverage = coverage.cumsum(axis=0).cumsum(axis=1)[:width, :height]
+    tiles[coverage > 0] = FLOOR
+
+def __add_random_enemies_to_level(rng, level, levelnum, element=NO_ELEMENT):
     """Add enemies to a level, making sure to place them in valid positions."""
-    spawn_pool = __generate_spawn_pool(levelnum)
-    for _ in range(20 + 2*levelnum):
-        x, y = __random_enemy_spawn(level, grid)
-        grid[x][y].append("enemy")
-        entity = getattr(entity_templates, random.choice(spawn_pool))(x, y)
-        if random.randint(1, 2) == 1:
-            if level_type == "ice":
-                entity.append(IceElement())
-            if level_type == "fire":
-                entity.append(FireElement())
-        level.entities.append(entity)
+    spawn_pool = [CREATURE_TEMPLATES.index(name) for name in __generate_spawn_pool(levelnum)]
+
+    spawn_mask = (level.tiles != WALL) & (level.tiles != STAIRS)
+    spawn_mask[level.player_start] = False
+    positions = _random_tile(rng, spawn_mask, 20 + 2*levelnum)
+
+    amount = len(positions)
+    creatures = np.empty((amount, 4), dtype=np.int32)
+    creatures[:, 0] = rng.choice(spawn_pool, amount)
+    creatures[:, 1:3] = positions
+    creatures[:, 3] = np.where(rng.integers(0, 2, amount) == 0, element, NO_ELEMENT)
+    level.add_creatures(creatures)
 
 
 def generate_fly_boss_level(gridsize):
     """Return a Level object for the fly boss level."""
 
-    level = Level((2, 15))
-    grid = Grid(gridsize)
-
-    main_room = Rect(5, 5, 20, 20)
+    level = Level(gridsize, (2, 15))
+    tiles = level.tiles
 
-    for x, y, cell in grid:
-        if not main_room.collidepoint(x, y):
-            cell.append("wall")
+    tiles[:] = WALL
+    tiles[5:25, 5:25] = FLOOR # Main room
+    tiles[1:5, 14:17] = FLOOR
+    tiles[8, 14:17] = WALL
 
-    for x in range(1, 5):
-        for y in range(14, 17):
-            grid[x][y].remove("wall")
+    level.add_creatures((
+        (CREATURE_TEMPLATES.index("fly"), 7, 15, NO_ELEMENT),
+        (CREATURE_TEMPLATES.index("fly_wizard"), 22, 15, NO_ELEMENT)
+    ))
 
-    for y in range(14, 17):
-        grid[8][y].append("wall")
+    return level
 
-    grid[7][15].append("fly")
-    grid[22][15].append("fly_wizard")
+def generate_random_level(gridsize, levelnum, level_type, seed=None):
+    """Return a randomly generated Level object.
 
-    __add_grid_to_level(level, grid)
+    If seed is None, the seed is taken from the level generation stream.
+    """
+    if seed is None:
+        seed = random_streams.stream("level_gen").getrandbits(64)
+    rng = np.random.default_rng(seed)
+    element = LEVEL_TYPE_ELEMENTS.get(level_type, NO_ELEMENT)
 
-    return level
+    level = Level(gridsize)
+    tiles = level.tiles
+    for attempt in range(1, MAX_CARVE_ATTEMPTS+1):
+        tiles[:] = WALL
+        __carve_rooms(rng, tiles)
+        if (tiles != WALL).mean() >= MIN_OPEN_RATIO:
+            break
 
-def generate_random_level(gridsize, levelnum, level_type):
-    """Return a randomly generated Level object."""
+    # Loot
+    loot_x, loot_y = _random_tile(rng, tiles[:-1, :-1] != WALL)
+    tiles[loot_x:loot_x+2, loot_y:loot_y+2] = rng.choice(LOOT, (2, 2))
+
+    # Making sure everything placed from here on can be reached
+    t_start = time.perf_counter()
+    regions, carved = connect_regions(tiles)
+    level.generation_stats = {
+        "carve_attempts": attempt,
+        "regions": regions,
+        "corridor_tiles": carved,
+        "repair_ms": (time.perf_counter() - t_start) * 1000
+    }
 
-    grid = Grid(gridsize)
+    # Stairs down
+    tiles[_random_tile(rng, tiles == FLOOR)] = STAIRS
 
-    for x, y, cell in grid:
-        cell.append("wall")
+    loot_positions = _random_tile(rng, tiles == FLOOR, rng.integers(2, 6))
+    tiles[loot_positions[:, 0], loot_positions[:, 1]] = rng.choice(LOOT, len(loot_positions))
 
-    for roomx, roomy, _ in grid:
-        roomheight = random.randint(2, 6)
-        roomwidth = random.randint(2, 6)
-        if roomx + roomwidth <= grid.width and roomy + roomheight <= grid.height and random.randint(1, 15) == 1:
-            for x in range(0, roomwidth):
-                for y in range(0, roomheight):
-                    entities = grid[roomx+x][roomy+y]
-                    if "wall" in entities:
-                        entities.remove("wall")
+    # Elemental walls
+    if element != NO_ELEMENT:
+        level.elements[(tiles == WALL) & (rng.integers(0, 3, tiles.shape) == 0)] = element
 
-    # Stairs down
-    exit_x, exit_y = __random_empty_pos(grid)
-    grid[exit_x][exit_y].append("stairs")
+    level.player_start = tuple(int(i) for i in _random_tile(rng, tiles == FLOOR))
 
-    # Loot
-    loot_x = random.randint(0, grid.width-2)
-    loot_y = random.randint(0, grid.height-2)
-    while "wall" in grid[loot_x][loot_y]:
-        loot_x = random.randint(0, grid.width-2)
-        loot_y = random.randint(0, grid.height-2)
-    for x in range(loot_x, loot_x + 2):
-        for y in range(loot_y, loot_y + 2):
-            if "wall" in grid[x][y]:
-                grid[x][y].remove("wall")
-            grid[x][y].append(__random_loot())
-
-    for _ in range(random.randint(2, 5)):
-        x, y = __random_empty_pos(grid)
-        grid[x][y].append(__random_loot())
-
-    # Making Level object
-    player_start = __random_empty_pos(grid)
-    level = Level(player_start)
-
-    # Adding grid and enemies to level
-    __add_grid_to_level(level, grid, level_type)
-
-    __add_random_enemies_to_level(level, grid, levelnum, level_type)
+    __add_random_enemies_to_level(rng, level, levelnum, element)
 
     return level
+
+def get_level_type(properties):
+    """Return the type of level a dungeon node has given its properties."""
+    if "boss" in properties:
+        return "boss"
+    if "fire" in properties:
+        return "fire"
+    return "normal"
+
+def generate_level(gridsize, levelnum, properties, seed=None):
+    """Return a Level object for a dungeon node given its properties."""
+    level_type = get_level_type(properties)
+    if level_type == "boss":
+        return generate_fly_boss_level(gridsize)
+    return generate_random_level(gridsize, levelnum, level_type, seed)
@@ -0,0 +1,123 @@
+"""Contains the SnapshotStore class which keeps the state of levels the player has left."""
+
+import io
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+
+
+class SnapshotStore:
+    """Stores compressed snapshots by key. A snapshot is a dictionary with picklable keys and values.
+
+    Snapshots are compressed a batch of items at a time over calls to SnapshotStore.work,
+    so that storing a big snapshot doesn't stall a frame.
+    They are kept in memory until they take up more than max_memory_bytes,
+    then the oldest ones are spilled to a temporary directory on disk.
+    """
+    def __init__(self, max_memory_bytes, batch_size):
+        self.max_memory_bytes = max_memory_bytes
+        self.batch_size = batch_size
+        self._pending = OrderedDict() # Keys to generators which compress their snapshot
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = {}
+        self._directory = None
+        self._files_written = 0
+
+    def __contains__(self, key):
+        return key in self._pending or key in self._memory or key in self._disk
+
+    def __len__(self):
+        return len(self._pending) + len(self._memory) + len(self._disk)
+
+    def store(self, key, snapshot):
+        """Start storing a snapshot, replacing any snapshot with the same key.
+
+        The snapshot is compressed by later calls to SnapshotStore.work, so it mustn't change until then.
+        """
+        self.discard(key)
+        self._pending[key] = self._compress(key, snapshot)
+
+    def _compress(self, key, snapshot):
+        """Return a generator which compresses a snapshot a batch of items at a time, then stores it in memory.
+
+        The compressed data is a pickled dictionary for each batch.
+        """
+        compressor = zlib.compressobj()
+        chunks = []
+        items = list(snapshot.items())
+        for start in range(0, len(items), self.batch_size):
+            yield
+            batch = dict(items[start:start+self.batch_size])
+            chunks.append(compressor.compress(pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)))
+        chunks.append(compressor.flush())
+        data = b"".join(chunks)
+        del self._pending[key]
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        self._spill()
+
+    def work(self, seconds):
+        """Spend up to a number of seconds compressing snapshots which are being stored."""
+        t_end = time.perf_counter() + seconds
+        while self._pending and time.perf_counter() < t_end:
+            for _ in next(iter(self._pending.values())):
+                if time.perf_counter() >= t_end:
+                    return
+
+    def _finish(self, key):
+        """Finish compressing a snapshot now if it is still being stored."""
+        if key in self._pending:
+            for _ in self._pending[key]:
+                pass
+
+    def get(self, key):
+        """Return a snapshot without removing it.
+
+        Raises a KeyError if there is no snapshot with this key.
+        """
+        self._finish(key)
+        if key in self._memory:
+            data = self._memory[key]
+        else:
+            with open(self._disk[key], 'rb') as snapshot_file:
+                data = snapshot_file.read()
+        data = zlib.decompress(data)
+        snapshot = {}
+        snapshot_file = io.BytesIO(data)
+        while snapshot_file.tell() < len(data):
+            snapshot.update(pickle.load(snapshot_file))
+        return snapshot
+
+    def pop(self, key):
+        """Remove a snapshot and return it.
+
+        Raises a KeyError if there is no snapshot with this key.
+        """
+        snapshot = self.get(key)
+        self.discard(key)
+        return snapshot
+
+    def discard(self, key):
+        """Remove a snapshot if there is one with this key."""
+        self._pending.pop(key, None)
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        if key in self._disk:
+            os.remove(self._disk.pop(key))
+
+    def _spill(self):
+        """Write the oldest snapshots to disk until the ones in memory fit in the memory budget."""
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            if self._directory is None:
+                self._directory = tempfile.TemporaryDirectory(prefix="gim-levels-")
+            key, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self._files_written += 1
+            path = os.path.join(self._directory.name, str(self._files_written))
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            self._disk[key] = path
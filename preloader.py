@@ -0,0 +1,40 @@
+"""Contains the Preloader class which loads assets in the background."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Preloader:
+    """Runs loading tasks on a pool of threads, keeping track of how many have finished.
+
+    Tasks should only decode data, since surfaces can't be safely used off the main thread.
+    """
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="preload")
+        self._futures = []
+
+    def submit(self, function, *args):
+        """Start running function(*args) in the background, returning its Future."""
+        future = self._executor.submit(function, *args)
+        self._futures.append(future)
+        return future
+
+    @property
+    def progress(self):
+        """Get the fraction of tasks which have finished, from 0 to 1."""
+        if not self._futures:
+            return 1
+        return sum(future.done() for future in self._futures) / len(self._futures)
+
+    @property
+    def done(self):
+        """Get whether every task has finished."""
+        return all(future.done() for future in self._futures)
+
+    def wait(self):
+        """Wait for every task to finish, raising the first error that a task raised."""
+        for future in self._futures:
+            future.result()
+
+    def shutdown(self):
+        """Stop the threads once their running tasks have finished, cancelling the tasks which haven't started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
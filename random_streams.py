@@ -0,0 +1,78 @@
+"""Contains named random number streams which are all derived from one master seed.
+
+Each part of the game draws from its own stream, so that e.g. drawing the camera shake
+doesn't change what the AI does, and levels can be generated in any order or process.
+"""
+
+import hashlib
+import random
+
+_master_seed = None
+_streams = {}
+_scope = None
+
+def seed(master_seed=None):
+    """Set the master seed and reset all streams.
+
+    If master_seed is None, a random master seed is used.
+    """
+    global _master_seed
+    if master_seed is None:
+        master_seed = random.SystemRandom().getrandbits(64)
+    _master_seed = master_seed
+    _streams.clear()
+
+def get_master_seed():
+    """Return the current master seed."""
+    return _master_seed
+
+def derive_seed(*names, master_seed=None):
+    """Return a 64 bit seed derived from the master seed and a name.
+
+    names can be any values with a stable repr, e.g. ("level", (0, 1), 2).
+    A master seed other than the current one can be given.
+    """
+    if master_seed is None:
+        master_seed = _master_seed
+    digest = hashlib.sha256(repr((master_seed, names)).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+def stream(*names):
+    """Return the random.Random stream for a name, creating it the first time it is used.
+
+    Inside a StreamScope, the scope's stream for the name is returned instead.
+    """
+    if _scope is not None:
+        return _scope.stream(*names)
+    if names not in _streams:
+        _streams[names] = random.Random(derive_seed(*names))
+    return _streams[names]
+
+class StreamScope:
+    """A separate set of streams, derived from the scope's names as well as their own.
+
+    While a scope is used in a with statement, stream returns the scope's streams, so that e.g. a level's
+    entities get the same random numbers however many times and whenever it is built.
+    """
+    def __init__(self, *names):
+        self.names = names
+        self._streams = {}
+        self._outer_scope = None
+
+    def stream(self, *names):
+        """Return the scope's random.Random stream for a name, creating it the first time it is used."""
+        if names not in self._streams:
+            self._streams[names] = random.Random(derive_seed(*self.names, *names))
+        return self._streams[names]
+
+    def __enter__(self):
+        global _scope
+        self._outer_scope = _scope
+        _scope = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _scope
+        _scope = self._outer_scope
+
+seed()
@@ -2,37 +2,96 @@
 Contains the Renderer of Gim Descent.
 '''
 
-from functools import lru_cache
+import math
+import time
 
 import pygame
 
 import constants
+import texture_atlas
+from sprite_cache import SpriteCache, surface_bytes
 
-
-@lru_cache(maxsize=None)
-def _import_image(name):
-    try:
-        image = pygame.image.load(constants.IMAGES+name+".png").convert_alpha()
-    except pygame.error:
-        image = pygame.image.load(constants.DEFAULT_IMAGES+name+".png").convert_alpha()
-    return image
+# The sprite pyramid is only made of sprites no bigger than this, not of menu backgrounds etc.
+PYRAMID_MAX_SPRITE_SIZE = constants.TILE_SIZE * 2
 
 class Renderer:
-    """Rendering wrapper which stores cached surfaces."""
-    def __init__(self):
+    """Rendering wrapper which stores cached surfaces.
+
+    Surfaces are kept in a SpriteCache bounded by max_cache_bytes, which comes from the sprite_cache_mb setting.
+    """
+    def __init__(self, max_cache_bytes):
         self.total_images = 0
+        self.sprite_cache = SpriteCache(max_cache_bytes, constants.SPRITE_CACHE_MAX_ENTRIES)
+        self._scaling_time = 0
+        self.approximate_images = 0
+        self._atlas = None
+        self._pyramid = {scale: {} for scale in constants.SPRITE_PYRAMID_SCALES if scale != 1}
+        self._pyramid_queue = None
+
+    @property
+    def atlas(self):
+        """Get the TextureAtlas of all images, loading it the first time it is used."""
+        if self._atlas is None:
+            self._atlas = texture_atlas.load()
+        return self._atlas
+
+    def _pyramid_image(self, scale, name):
+        """Return a sprite from the sprite pyramid, scaling it now if it hasn't been yet.
+
+        Returns None if the sprite is too big to be in the pyramid.
+        """
+        images = self._pyramid[scale]
+        if name not in images:
+            image = self.atlas.get_image(name)
+            if max(image.get_size()) > PYRAMID_MAX_SPRITE_SIZE:
+                return None
+            t_start = time.perf_counter()
+            images[name] = pygame.transform.scale(image, (int(image.get_width()*scale), int(image.get_height()*scale)))
+            self._scaling_time += time.perf_counter() - t_start
+        return images[name]
+
+    def _build_pyramid(self):
+        """Scale sprites into the sprite pyramid one at a time until the frame's scaling budget is spent."""
+        if self._pyramid_queue is None:
+            self._pyramid_queue = [
+                (scale, name) for scale in self._pyramid for name, (_, rect) in self.atlas.rects.items()
+                if max(rect.size) <= PYRAMID_MAX_SPRITE_SIZE
+            ]
+        while self._pyramid_queue and self._scaling_time < constants.SPRITE_SCALING_BUDGET:
+            self._pyramid_image(*self._pyramid_queue.pop())
 
-    @lru_cache(maxsize=None)
     def get_image(self, **args):
         """Get an image. Optional modifier parameters like scale and color can be used.
 
-        Function is cached with lru_cache.
+        Images without a color or blinking are subsurfaces of the texture atlas at a scale of 1,
+        or come from the sprite pyramid at its other scales. Other images are scaled on their own.
+        Images are shared by everything that gets them, so they mustn't be drawn on; copy them first.
+        Images are cached in the sprite cache, where atlas subsurfaces and pyramid sprites don't count
+        towards its budget as their pixels belong to the atlas and the pyramid.
         """
+        key = tuple(sorted(args.items()))
+        image = self.sprite_cache.get("image", key)
+        if image is None:
+            image = self._make_image(**args)
+            shared = image.get_parent() is not None or any(image is images.get(args["name"]) for images in self._pyramid.values())
+            self.sprite_cache.put("image", key, image, 0 if shared else None)
+        return image
+
+    def _make_image(self, **args):
+        """Return a new image given the parameters of get_image."""
         if "scale" not in args:
             args["scale"] = 1
 
         self.total_images += 1
-        image = _import_image(args["name"]).copy()
+        if "color" not in args and not args.get("blinking"):
+            if args["scale"] == 1:
+                return self.atlas.get_image(args["name"])
+            if args["scale"] in self._pyramid:
+                image = self._pyramid_image(args["scale"], args["name"])
+                if image is not None:
+                    return image
+
+        image = self.atlas.get_image(args["name"]).copy()
         if "scale" in args:
             image = pygame.transform.scale(image, (int(image.get_width()*args["scale"]), int(image.get_height()*args["scale"])))
 
@@ -45,23 +104,70 @@ class Renderer:
 
         return image
 
+    def _get_glyph_atlas(self, size):
+        """Get a TextureAtlas of every text character at a size, which is cached in the sprite cache.
+
+        The glyphs aren't colored, so that one atlas serves text of every color.
+        """
+        glyph_atlas = self.sprite_cache.get("glyphs", size)
+        if glyph_atlas is None:
+            glyphs = {
+                name: self._make_image(name=name, scale=size*0.2)
+                for name in self.atlas.rects if name.startswith(("txt-", "txt_"))
+            }
+            glyph_atlas = texture_atlas.pack(glyphs)
+            self.sprite_cache.put("glyphs", size, glyph_atlas, sum(surface_bytes(page) for page in glyph_atlas.pages))
+        return glyph_atlas
+
+    def text_surface(self, color, text, size, x_offset=0):
+        """Return a transparent surface with text on it, which is cached in the sprite cache.
+
+        x_offset is the fraction of a pixel that the text is drawn to the right of the surface's position.
+        Characters land on the same pixels as if each was drawn at its own position.
+        """
+        color = (color[0], color[1], color[2], pygame.BLEND_ADD)
+        key = (text, size, color, x_offset)
+        surface = self.sprite_cache.get("text", key)
+        if surface is None:
+            surface = self._make_text_surface(color, text, size, x_offset)
+            self.sprite_cache.put("text", key, surface)
+        return surface
+
+    def _make_text_surface(self, color, text, size, x_offset):
+        """Return a new text surface, built from the glyph atlas with one blits call per atlas page, then colored."""
+        glyph_atlas = self._get_glyph_atlas(size)
+        character_width = size * 0.8
+        glyphs = []
+        for i, character in enumerate(text):
+            if character in constants.SPECIAL_CHARS:
+                char_name = "txt_"+ constants.SPECIAL_CHARS[character]
+            else:
+                char_name = "txt-"+character.lower()
+            glyphs.append((char_name, (int(x_offset + i * character_width), 0)))
+
+        width = height = 0
+        for char_name, (x, _) in glyphs:
+            rect = glyph_atlas.rects[char_name][1]
+            width = max(width, x + rect.width)
+            height = max(height, rect.height)
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        # Glyphs don't overlap, so their pixels are copied rather than blended
+        glyph_atlas.blits(surface, glyphs, special_flags=pygame.BLEND_RGBA_MAX)
+        surface.fill(color[0:3], special_flags=color[3])
+        return surface
+
     def draw_text(self, surface, color, pos, text, size, centered=False):
         """Draw text to a surface.
 
         size refers to the height of each character in pixels.
         """
-        color = (color[0], color[1], color[2], pygame.BLEND_ADD)
         character_width = size * 0.8
 
         if centered:
             pos = (pos[0] - (len(text)/2) * character_width + 0.1 * size, pos[1] - size * 0.5)
 
-        for i, character in enumerate(text):
-            if character in constants.SPECIAL_CHARS:
-                char_name = "txt_"+ constants.SPECIAL_CHARS[character]
-            else:
-                char_name = "txt-"+character.lower()
-            surface.blit(self.get_image(name=char_name, scale=size*0.2, color=color), (pos[0] + i * character_width, pos[1]))
+        x = int(pos[0]) # Truncated like the positions of blits
+        surface.blit(self.text_surface(color, text, size, pos[0] - x), (x, pos[1]))
 
     def make_text(self, color, text, size):
         """Return a surface containing text."""
@@ -84,9 +190,16 @@ class Renderer:
         """Blit an image to a surface, centering it at centerpos."""
         surface.blit(image, (centerpos[0] - image.get_width()//2, centerpos[1] - image.get_height()//2))
 
-    @lru_cache(maxsize=None)
     def _icon_image(self, icons, scale):
-        """Return an icons surface."""
+        """Return an icons surface, which is cached in the sprite cache."""
+        image = self.sprite_cache.get("icons", (icons, scale))
+        if image is None:
+            image = self._make_icon_image(icons, scale)
+            self.sprite_cache.put("icons", (icons, scale), image)
+        return image
+
+    def _make_icon_image(self, icons, scale):
+        """Return a new icons surface."""
         images = []
 
         for i, icon in enumerate(icons):
@@ -128,9 +241,39 @@ class Renderer:
 
         return surface
 
-    @lru_cache(maxsize=None)
-    def entity_image(self, scale, **draw_data):
-        """Return an entity surface given draw data."""
+    def start_frame(self):
+        """Reset how much time has been spent scaling images this frame."""
+        self._scaling_time = 0
+
+    def end_frame(self):
+        """Spend what is left of the frame's scaling budget on building the sprite pyramid, a sprite at a time."""
+        self._build_pyramid()
+
+    def entity_image(self, scale, draw_key):
+        """Return an entity surface given a draw key, which is cached in the sprite cache.
+
+        A draw key is a sorted tuple of the items of the entity's draw data.
+
+        Once more than constants.SPRITE_SCALING_BUDGET seconds have been spent making entity images
+        in a frame, the image at the nearest scale of constants.SPRITE_PYRAMID_SCALES is returned instead.
+        The image at the exact scale is then made in a later frame, so that zooming doesn't stall a frame.
+        approximate_images counts how many times this has happened, so that callers can redraw cached surfaces.
+        """
+        key = (scale, draw_key)
+        image = self.sprite_cache.get("entity", key)
+        if image is None:
+            if self._scaling_time > constants.SPRITE_SCALING_BUDGET and scale not in constants.SPRITE_PYRAMID_SCALES:
+                self.approximate_images += 1
+                nearest_scale = min(constants.SPRITE_PYRAMID_SCALES, key=lambda level: abs(math.log(level/scale)))
+                return self.entity_image(nearest_scale, draw_key)
+            t_start = time.perf_counter()
+            image = self._make_entity_image(scale, **dict(draw_key))
+            self._scaling_time += time.perf_counter() - t_start
+            self.sprite_cache.put("entity", key, image)
+        return image
+
+    def _make_entity_image(self, scale, **draw_data):
+        """Return a new entity surface given draw data."""
         images = []
         rects = []
 
@@ -0,0 +1,89 @@
+"""Contains the SpriteCache class which keeps rendered surfaces within a memory budget."""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheStats:
+    """Stores statistics about one family of cache keys."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+def surface_bytes(surface):
+    """Return roughly how much memory a surface's pixels take up."""
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class SpriteCache:
+    """A least recently used cache of surfaces, bounded by how many there are and their total size.
+
+    Keys are grouped into families such as "image" or "entity", which each keep their own statistics.
+    """
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.stats = {}
+        self._surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def _get_stats(self, family):
+        """Return the statistics of a family, creating them the first time it is used."""
+        if family not in self.stats:
+            self.stats[family] = CacheStats()
+        return self.stats[family]
+
+    def get(self, family, key):
+        """Return a cached surface and mark it as recently used, or return None if it isn't cached."""
+        entry = self._surfaces.get((family, key))
+        stats = self._get_stats(family)
+        if entry is None:
+            stats.misses += 1
+            return None
+        stats.hits += 1
+        self._surfaces.move_to_end((family, key))
+        return entry[0]
+
+    def put(self, family, key, surface, size=None):
+        """Cache a surface, then evict the least recently used surfaces until the cache is within its bounds.
+
+        Other objects can be cached too, as long as their size in bytes is given.
+        Surfaces whose pixels are owned by something else can be given a size of 0.
+        """
+        if size is None:
+            size = surface_bytes(surface)
+        stats = self._get_stats(family)
+        if (family, key) in self._surfaces:
+            self._remove((family, key))
+        self._surfaces[(family, key)] = (surface, size)
+        self.bytes += size
+        stats.entries += 1
+        stats.bytes += size
+
+        while len(self._surfaces) > 1 and (self.bytes > self.max_bytes or len(self._surfaces) > self.max_entries):
+            oldest = next(iter(self._surfaces))
+            self._remove(oldest)
+            self.stats[oldest[0]].evictions += 1
+
+    def _remove(self, full_key):
+        """Remove an entry given its (family, key) pair."""
+        _, size = self._surfaces.pop(full_key)
+        stats = self.stats[full_key[0]]
+        self.bytes -= size
+        stats.entries -= 1
+        stats.bytes -= size
+
+    def clear(self):
+        """Remove every surface, keeping the statistics of hits, misses and evictions."""
+        self._surfaces.clear()
+        self.bytes = 0
+        for stats in self.stats.values():
+            stats.entries = 0
+            stats.bytes = 0
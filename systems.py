@@ -1,13 +1,13 @@
 """Contains all the ECS Systems."""
 
 import math
-import random
 
 import audio
 import components as c
 import constants
 import entity_templates
 import key_input
+import random_streams
 from ecs import System
 
 
@@ -33,6 +33,19 @@ class GridSystem(System):
         self.blocker_grid = self.blocker_grid = [[0 for y in range(self.gridheight)] for x in range(self.gridwidth)]
         self.grid = self.grid = [[set() for y in range(self.gridheight)] for x in range(self.gridwidth)]
         self._cached_pos = {}
+        self._bump_targets = {}
+        self._cached_bump = {}
+        self._tile_observers = []
+
+    def add_tile_observer(self, observer):
+        """Call observer(entity, pos) whenever an entity is put on or taken off a tile."""
+        self._tile_observers.append(observer)
+
+    def _tiles_changed(self, entity, *positions):
+        """Tell the tile observers that an entity has been put on or taken off some tiles."""
+        for observer in self._tile_observers:
+            for pos in positions:
+                observer(entity, pos)
 
     def on_grid(self, pos):
         """Return True if a position is on the grid."""
@@ -43,9 +56,9 @@ class GridSystem(System):
 
     def random_adjacent_free_pos(self, pos):
         """Return a random adjacent tile, or None if they are all blocked."""
-        for offset in [*random.sample(self.adjacent, len(self.adjacent)), (0, 0)]:
+        for offset in [*random_streams.stream("grid").sample(self.adjacent, len(self.adjacent)), (0, 0)]:
             test_pos = [pos[i]+offset[i] for i in range(2)]
-            if self.world.get_system(GridSystem).get_blocker_at(test_pos) == 0 and self.on_grid(test_pos):
+            if self.on_grid(test_pos) and self.get_blocker_at(test_pos) == 0:
                 return test_pos
         return None
 
@@ -54,8 +67,9 @@ class GridSystem(System):
 
         WARNNG: Does not mark the returned position as blocked.
         """
+        rng = random_streams.stream("grid")
         while True:
-            randpos = (random.randrange(self.gridwidth), random.randrange(self.gridheight))
+            randpos = (rng.randrange(self.gridwidth), rng.randrange(self.gridheight))
             if self.get_blocker_at(randpos) == 0:
                 return randpos
 
@@ -78,6 +92,21 @@ class GridSystem(System):
         """Get ids of all entities at a certain position."""
         return self.grid[pos[0]][pos[1]]
 
+    def get_entities_in_rect(self, min_pos, max_pos):
+        """Get ids of all entities on tiles between two positions, inclusive.
+
+        The rect is clamped to the grid. Entities are ordered by row, then column, then id.
+        """
+        min_x, min_y = max(min_pos[0], 0), max(min_pos[1], 0)
+        max_x, max_y = min(max_pos[0], self.gridwidth-1), min(max_pos[1], self.gridheight-1)
+        entities = []
+        for y in range(min_y, max_y+1):
+            for x in range(min_x, max_x+1):
+                tile = self.grid[x][y]
+                if tile:
+                    entities.extend(sorted(tile))
+        return entities
+
     def move_entity(self, entity, pos):
         """Move an entity to a position, raising an error if not possible."""
         entity_pos = self.world.entity_component(entity, c.TilePosition)
@@ -90,10 +119,42 @@ class GridSystem(System):
             else:
                 raise IndexError("Entity moving to an occupied tile")
 
+        old_pos = (entity_pos.x, entity_pos.y)
         self.grid[entity_pos.x][entity_pos.y].remove(entity)
         entity_pos.x, entity_pos.y = pos
         self.grid[entity_pos.x][entity_pos.y].add(entity)
         self._cached_pos[entity] = pos
+        self._tiles_changed(entity, old_pos, tuple(pos))
+
+        if entity in self._cached_bump: # Keep a pending bump pointing at the right tile
+            bump = self.world.entity_component(entity, c.Bump)
+            self._index_bump(entity, (pos[0]+bump.x, pos[1]+bump.y))
+
+    def add_bump(self, entity, direction):
+        """Give an entity a Bump component and index the tile it is bumping into."""
+        self.world.add_component(entity, c.Bump(*direction))
+        pos = self.world.entity_component(entity, c.TilePosition)
+        self._index_bump(entity, (pos.x+direction[0], pos.y+direction[1]))
+
+    def _index_bump(self, entity, target_pos):
+        """Store an entity under the tile it is bumping into, replacing any older entry."""
+        if entity in self._cached_bump:
+            self._bump_targets[self._cached_bump[entity]].discard(entity)
+        self._cached_bump[entity] = target_pos
+        self._bump_targets.setdefault(target_pos, set()).add(entity)
+
+    def get_bump_target(self, entity):
+        """Get the tile position an entity is bumping into."""
+        return self._cached_bump[entity]
+
+    def get_bumpers_at(self, pos):
+        """Get ids of all entities bumping into a certain position."""
+        return self._bump_targets.get(tuple(pos), ())
+
+    def clear_bumps(self):
+        """Forget all indexed bumps. Called once the Bump components are removed."""
+        self._bump_targets.clear()
+        self._cached_bump.clear()
 
     def remove_pos(self, entity):
         """Remove an entity from the grid."""
@@ -102,14 +163,34 @@ class GridSystem(System):
         if self.blocker_grid[cache_x][cache_y] == entity:
             self.blocker_grid[cache_x][cache_y] = 0
         del self._cached_pos[entity]
+        self._tiles_changed(entity, (cache_x, cache_y))
+
+    def insert(self, entity):
+        """Add a single entity to the grid at its TilePosition.
+
+        Does nothing if the entity is already on the grid.
+        """
+        if entity in self._cached_pos:
+            return
+        pos = self.world.entity_component(entity, c.TilePosition)
+        self._cached_pos[entity] = (pos.x, pos.y)
+        self.grid[pos.x][pos.y].add(entity)
+        if self.world.has_component(entity, c.Blocker):
+            self.blocker_grid[pos.x][pos.y] = entity
+        self._tiles_changed(entity, (pos.x, pos.y))
+
+    def spawn_at(self, template, pos):
+        """Create an entity from a template function at a position and add it to the grid.
+
+        Returns the new entity.
+        """
+        entity = self.world.create_entity(*template(*pos))
+        self.insert(entity)
+        return entity
 
     def process(self, **args):
-        for entity, pos in self.world.get_component(c.TilePosition):
-            if not entity in self._cached_pos:
-                self._cached_pos[entity] = (pos.x, pos.y)
-                self.grid[pos.x][pos.y].add(entity)
-                if self.world.has_component(entity, c.Blocker):
-                    self.blocker_grid[pos.x][pos.y] = entity
+        for entity, _ in self.world.get_component(c.TilePosition):
+            self.insert(entity)
 
         for entity in tuple(self._cached_pos):
             if not self.world.has_component(entity, c.TilePosition):
@@ -123,6 +204,7 @@ class GridSystem(System):
 
                 self.grid[cache_x][cache_y].remove(entity)
                 self.grid[pos.x][pos.y].add(entity)
+                self._tiles_changed(entity, (cache_x, cache_y), (pos.x, pos.y))
 
 
                 if self.blocker_grid[cache_x][cache_y] == entity:
@@ -155,6 +237,7 @@ class InitiativeSystem(System):
             if self.world.has_component(entity, c.Initiative):
                 if self.tick:
                     freeturn.life -= 1
+                    self.world.mark_changed(entity)
                     if freeturn.life <= 0:
                         self.world.remove_component(entity, c.FreeTurn)
 
@@ -188,7 +271,7 @@ class PlayerInputSystem(System):
 
         if bumppos is not None:
             for entity, _ in self.world.get_components(c.PlayerInput, c.MyTurn):
-                self.world.add_component(entity, c.Bump(*bumppos))
+                self.world.get_system(GridSystem).add_bump(entity, bumppos)
 
 
 class AIFlyWizardSystem(System):
@@ -207,6 +290,7 @@ class AIFlyWizardSystem(System):
             self.game.teleport_entity(entity, 6)
 
         fly_ai.state = new_state
+        self.world.mark_changed(entity)
 
         if fly_ai.state == "asleep":
             render.imagename = "fly-wizard-i"
@@ -215,13 +299,13 @@ class AIFlyWizardSystem(System):
             self.world.add_component(entity, c.Initiative(2))
             render.imagename = "fly-wizard-r2"
             pos = self.world.entity_component(entity, c.TilePosition)
+            grid = self.world.get_system(GridSystem)
             for _ in range(5):
-                adjacent_pos = self.world.get_system(GridSystem).random_adjacent_free_pos((pos.x, pos.y))
+                adjacent_pos = grid.random_adjacent_free_pos((pos.x, pos.y))
                 if adjacent_pos:
-                    fly = self.world.create_entity(*entity_templates.fly(*adjacent_pos))
+                    fly = grid.spawn_at(entity_templates.fly, adjacent_pos)
                     if self.world.has_component(entity, c.Boss):
                         self.world.entity_component(entity, c.Boss).minions.append(fly)
-                    self.world.get_system(GridSystem).process()
 
         if fly_ai.state == "angry":
             self.world.add_component(entity, c.Initiative(1))
@@ -270,7 +354,7 @@ class AISystem(System):
                         movey = -1
                     if grid.get_blocker_at((pos.x+movex, pos.y+movey)) in (0, ai.target):
                         moved = True
-                        self.world.add_component(entity, c.Bump(movex, movey))
+                        grid.add_bump(entity, (movex, movey))
 
                 if not moved:
                     movex = targetpos.x - pos.x
@@ -288,7 +372,7 @@ class AISystem(System):
                         if movex > 0:
                             movex = 1
                     else:
-                        if random.random() < 0.5:
+                        if random_streams.stream("ai").random() < 0.5:
                             movey = 0
                             if movex < 0:
                                 movex = -1
@@ -304,7 +388,7 @@ class AISystem(System):
 
                     if grid.get_blocker_at((pos.x+movex, pos.y+movey)) in (0, ai.target):
                         moved = True
-                        self.world.add_component(entity, c.Bump(movex, movey))
+                        grid.add_bump(entity, (movex, movey))
 
                 if not moved:
                     if movex != 0:
@@ -323,20 +407,20 @@ class AISystem(System):
                             movex = 1
                     if grid.get_blocker_at((movex, movey)) in (0, ai.target):
                         moved = True
-                        self.world.add_component(entity, c.Bump(movex, movey))
+                        grid.add_bump(entity, (movex, movey))
             else:
                 if movement.diagonal:
                     moves = (*constants.DIRECTIONS, (-1, -1), (-1, 1), (1, -1), (1, 1))
                 else:
                     moves = constants.DIRECTIONS
-                moves = random.sample(moves, len(moves))
+                moves = random_streams.stream("ai").sample(moves, len(moves))
                 moved = False
                 move_id = 0
                 while not moved and move_id < len(moves):
                     move = moves[move_id]
                     move_pos = (pos.x+move[0], pos.y+move[1])
                     if grid.on_grid(move_pos) and grid.get_blocker_at(move_pos) == 0:
-                        self.world.add_component(entity, c.Bump(*move))
+                        grid.add_bump(entity, move)
                         moved = True
                     move_id += 1
 
@@ -373,24 +457,33 @@ class BurningSystem(System):
 class AIDodgeSystem(System):
     """Carries out dodges when an entity moves onto the same tile."""
     def process(self, **args):
+        grid = self.world.get_system(GridSystem)
         for entity, (pos, initiative, _) in self.world.get_components(c.TilePosition, c.Initiative, c.AIDodge):
             if initiative.nextturn > 1:
                 continue
-            for _, (o_pos, bump, _) in self.world.get_components(c.TilePosition, c.Bump, c.MyTurn):
-                bump_pos = c.TilePosition(o_pos.x+bump.x, o_pos.y+bump.y)
-                if bump_pos == pos:
-                    if self.world.get_system(GridSystem).can_move_in_direction(entity, (bump.x, bump.y)):
-                        self.world.get_system(GridSystem).move_entity(entity, (pos.x+bump.x, pos.y+bump.y))
-                        initiative.nextturn += initiative.speed # would like to remove MyTurn component but the ai doesn't have it yet, should change
+            # Every bumper is checked in creation order against the tile the entity is on by then, so it can dodge more than once
+            checked = 0
+            while True:
+                bumpers = [
+                    bumper for bumper in grid.get_bumpers_at((pos.x, pos.y))
+                    if bumper > checked and self.world.has_component(bumper, c.MyTurn)
+                ]
+                if not bumpers:
+                    break
+                checked = min(bumpers)
+                bump = self.world.entity_component(checked, c.Bump)
+                if grid.can_move_in_direction(entity, (bump.x, bump.y)):
+                    grid.move_entity(entity, (pos.x+bump.x, pos.y+bump.y))
+                    initiative.nextturn += initiative.speed # would like to remove MyTurn component but the ai doesn't have it yet, should change
 
 
 class BumpSystem(System):
     """Carries out bump actions, then deletes the Bump components."""
 
     def process(self, **args):
-        for entity, (pos, bump, _) in self.world.get_components(c.TilePosition, c.Bump, c.MyTurn):
+        for entity, _ in self.world.get_components(c.TilePosition, c.Bump, c.MyTurn):
 
-            bumppos = (pos.x + bump.x, pos.y + bump.y)
+            bumppos = self.world.get_system(GridSystem).get_bump_target(entity)
 
             if not self.world.get_system(GridSystem).on_grid(bumppos):
                 continue
@@ -428,6 +521,7 @@ class BumpSystem(System):
                         self.world.remove_component(entity, c.MyTurn)
         for entity, _ in self.world.get_component(c.Bump):
             self.world.remove_component(entity, c.Bump)
+        self.world.get_system(GridSystem).clear_bumps()
 
 
 class ExplosionSystem(System):
@@ -439,6 +533,7 @@ class ExplosionSystem(System):
             for entity, explosive in self.world.get_component(c.Explosive):
                 if explosive.primed:
                     explosive.fuse -= 1
+                    self.world.mark_changed(entity)
                     if explosive.fuse <= 1 and self.world.has_component(entity, c.Render):
                         self.world.entity_component(entity, c.Render).blinking = True
                     if explosive.fuse <= 0:
@@ -503,6 +598,7 @@ class DamageSystem(System):
 
             if self.world.has_component(damage.target, c.Explosive):
                 self.world.entity_component(damage.target, c.Explosive).primed = True
+                self.world.mark_changed(damage.target)
 
             if self.world.has_component(damage.target, c.AIFlyWizard):
                 if self.world.entity_component(damage.target, c.AIFlyWizard).state == "angry":
@@ -534,6 +630,7 @@ class PickupSystem(System):
                 for item, (item_pos, _) in self.world.get_components(c.TilePosition, c.Item):
                     if len(inventory.contents) < inventory.capacity:
                         if (item_pos.x, item_pos.y) == (pos.x, pos.y):
+                            self.world.get_system(GridSystem).remove_pos(item)
                             self.world.remove_component(item, c.TilePosition)
                             self.world.add_component(item, c.Stored(entity))
                             inventory.contents.append(item)
@@ -557,11 +654,11 @@ class SplitSystem(System):
         for entity, (split, _) in self.world.get_components(c.Split, c.Dead):
             if self.world.has_component(entity, c.TilePosition):
                 pos = self.world.entity_component(entity, c.TilePosition)
+                grid = self.world.get_system(GridSystem)
                 for template in split.entities:
-                    spawn_pos = self.world.get_system(GridSystem).random_adjacent_free_pos((pos.x, pos.y))
+                    spawn_pos = grid.random_adjacent_free_pos((pos.x, pos.y))
                     if spawn_pos:
-                        new_entity = self.world.create_entity(*template(*spawn_pos))
-                        self.world.get_system(GridSystem).process()
+                        new_entity = grid.spawn_at(template, spawn_pos)
                         if self.world.has_component(entity, c.IceElement):
                             self.world.add_component(new_entity, c.IceElement())
                         if self.world.has_component(entity, c.FireElement):
@@ -590,18 +687,21 @@ class StairsSystem(System):
                 if self.world.has_component(player, c.Inventory):
                     for entity in self.world.entity_component(player, c.Inventory).contents:
                         player_entities.append(entity)
-                # Delete all stored entities and entities with a position not relating to the player
+                level_entities = set()
                 for entity, _ in self.world.get_component(c.TilePosition):
                     if entity not in player_entities:
-                        self.world.add_component(entity, c.Delete())
+                        level_entities.add(entity)
                 for entity, _ in self.world.get_component(c.Stored):
                     if entity not in player_entities:
-                        self.world.add_component(entity, c.Delete())
+                        level_entities.add(entity)
+                self.game.parent.save_level_state(level_entities)
 
+                # The level's entities are left in this World, which stops being processed and is replaced by the next level's
                 if stair.is_exit:
                     self.game.show_win_screen()
                 else:
                     self.game.select_next_level()
+                return
 
 
 
@@ -639,7 +739,10 @@ class AnimationSystem(System):
                 animation.pos = int((animation.pos + frames_elapsed) %
                                     len(animation.current_animation))
 
-            render.imagename = animation.current_animation[animation.pos]
+            imagename = animation.current_animation[animation.pos]
+            if render.imagename != imagename:
+                render.imagename = imagename
+                self.world.mark_changed(entity)
 
 
 class DeadSystem(System):
@@ -650,9 +753,10 @@ class DeadSystem(System):
             if self.world.has_component(entity, c.Bomber): # Dropping bomb on bomber death
                 if self.world.has_component(entity, c.TilePosition):
                     pos = self.world.entity_component(entity, c.TilePosition)
-                    bomb = self.world.create_entity(*entity_templates.bomb(pos.x, pos.y))
+                    bomb = self.world.get_system(GridSystem).spawn_at(entity_templates.bomb, (pos.x, pos.y))
                     self.world.add_component(bomb, self.world.entity_component(entity, c.Explosive))
                     self.world.entity_component(bomb, c.Explosive).primed = True
+                    self.world.mark_changed(bomb)
 
             if self.world.has_component(entity, c.Boss):
                 # Deleting boss' minions
@@ -664,7 +768,7 @@ class DeadSystem(System):
                     # If this is the final boss entity, make stairs
                     if len(self.world.get_components(c.Boss, c.TilePosition)) == 1:
                         pos = self.world.entity_component(entity, c.TilePosition)
-                        self.world.create_entity(*entity_templates.exit_stairs(pos.x, pos.y))
+                        self.world.get_system(GridSystem).spawn_at(entity_templates.exit_stairs, (pos.x, pos.y))
 
             if entity != self.world.tags.player:
                 self.world.add_component(entity, c.Delete())
@@ -0,0 +1,124 @@
+"""Tests for how GameManager updates and draws scenes."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import pytest
+
+import constants
+import key_input
+from game_manager import GameManager # Imported before the scenes, like in gim.pyw
+from assets.scenes.main_menu import MainMenu # pylint: disable=unused-import
+from assets.scenes.character_select import CharacterSelect
+from assets.scenes.dungeon import Dungeon
+from assets.scenes.level import Level
+from assets.scenes.scene import Scene
+
+
+class FakeClock:
+    """A clock where every frame takes the same amount of time."""
+    def __init__(self, delta):
+        self.delta = delta
+
+    def tick(self, framerate=0):
+        return self.delta
+
+    def get_fps(self):
+        return 1000 / self.delta
+
+
+class RecordingScene(Scene):
+    """Records whether it has been updated before each draw."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.updates = 0
+        self.drawn_before_update = False
+
+    def update(self, delta):
+        self.updates += 1
+
+    def draw(self, screen):
+        if self.updates == 0:
+            self.drawn_before_update = True
+
+
+class SpawningScene(RecordingScene):
+    """Adds a RecordingScene child on its first update."""
+    def update(self, delta):
+        super().update(delta)
+        if not self.children:
+            self.add_child_scene(RecordingScene)
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "CONFIG_PATH", str(tmp_path / "config.cfg"))
+    for cache in ("LEVEL_CACHE", "ATLAS_CACHE", "ASSET_BUNDLE_CACHE"):
+        monkeypatch.setattr(constants, cache, os.path.join(str(tmp_path), cache.lower(), ""))
+    monkeypatch.setattr(Dungeon, "pregenerate_levels", lambda self, nodes: None) # So no worker process is started
+    pygame.init()
+    screen = pygame.display.set_mode((1200, 800))
+    constants.MENU_SCALE = 2
+    game = GameManager(1200, 800)
+    game.config.fixed_timestep = True
+    game.config.fps_cap = 0
+    game.clock = FakeClock(1) # Much shorter than GameManager.timestep
+    game.screen = screen
+    yield game
+    pygame.quit()
+
+
+def frame(game):
+    game.update()
+    game.draw(game.screen)
+
+
+def test_new_base_scene_is_updated_before_drawn(game):
+    game.change_base_scene(RecordingScene)
+    frame(game)
+    assert not game.base_scene.drawn_before_update
+
+
+def test_scene_added_during_update_is_updated_before_drawn(game):
+    game.change_base_scene(SpawningScene)
+    for _ in range(3):
+        frame(game)
+    child = game.base_scene.children[0]
+    assert child.updates > 0
+    assert not child.drawn_before_update
+
+
+def test_steps_follow_time_passed(game):
+    game.change_base_scene(RecordingScene)
+    frames = 1000
+    for _ in range(frames):
+        frame(game)
+    expected = frames / game.timestep
+    assert abs(game.base_scene.updates - expected) <= 2
+
+
+def test_early_step_does_not_delay_later_steps(game):
+    game.change_base_scene(RecordingScene)
+    frame(game)
+    assert game.base_scene.updates == 1
+    game.clock = FakeClock(game.timestep)
+    for updates in range(2, 6):
+        frame(game)
+        assert game.base_scene.updates == updates
+
+
+def test_entering_level_with_short_frames(game):
+    game.change_base_scene(CharacterSelect)
+    for _ in range(200):
+        if isinstance(game.focus_scene, Level):
+            break
+        keypress = key_input.Keypress(pygame.K_z)
+        game.input(keypress)
+        game.call_all_scenes("unfocused_input", keypress)
+        frame(game)
+    assert isinstance(game.focus_scene, Level)
+    for _ in range(20):
+        frame(game)
@@ -0,0 +1,31 @@
+"""Tests for the named random number streams."""
+
+import random_streams
+
+
+def test_scope_streams_are_the_same_however_often_they_are_used():
+    random_streams.seed(5)
+    with random_streams.StreamScope("level", (0, 0), 1):
+        first = [random_streams.stream("templates").random() for _ in range(5)]
+    random_streams.stream("templates").random()
+    with random_streams.StreamScope("level", (0, 0), 1):
+        second = [random_streams.stream("templates").random() for _ in range(5)]
+    assert first == second
+
+
+def test_scope_doesnt_change_global_streams():
+    random_streams.seed(5)
+    expected = random_streams.stream("templates").random()
+    random_streams.seed(5)
+    with random_streams.StreamScope("level", (0, 0), 1):
+        random_streams.stream("templates").random()
+    assert random_streams.stream("templates").random() == expected
+
+
+def test_scopes_differ_by_name():
+    random_streams.seed(5)
+    with random_streams.StreamScope("level", (0, 0), 1):
+        first = random_streams.stream("templates").random()
+    with random_streams.StreamScope("level", (0, 1), 1):
+        second = random_streams.stream("templates").random()
+    assert first != second
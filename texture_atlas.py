@@ -0,0 +1,153 @@
+'''
+Packs sprites into a few large surfaces, so that they are loaded from disk in one go
+and drawn from one source surface.
+
+The atlas of every image is saved in the cache with an index of where each sprite is,
+and is only packed again when an image is newer than it.
+'''
+
+import json
+import os
+
+import pygame
+
+import constants
+
+PAGE_SIZE = 1024
+PADDING = 1
+INDEX_VERSION = 1
+INDEX_NAME = "atlas.json"
+
+
+class TextureAtlas:
+    """Stores pages of packed sprites and where each sprite is on them."""
+    def __init__(self, pages, rects):
+        self.pages = pages
+        self.rects = rects
+        self._subsurfaces = {}
+
+    def __contains__(self, name):
+        return name in self.rects
+
+    def get_rect(self, name):
+        """Return the page surface and rect of a sprite."""
+        page, rect = self.rects[name]
+        return self.pages[page], rect
+
+    def get_image(self, name):
+        """Return a sprite as a subsurface of its page. Drawing on it would draw on the page."""
+        if name not in self._subsurfaces:
+            page, rect = self.get_rect(name)
+            self._subsurfaces[name] = page.subsurface(rect)
+        return self._subsurfaces[name]
+
+    def blits(self, surface, sprites, special_flags=0):
+        """Blit many (name, position) pairs to a surface, with one blits call for each page."""
+        page_blits = [[] for _ in self.pages]
+        for name, pos in sprites:
+            page, rect = self.rects[name]
+            page_blits[page].append((self.pages[page], pos, rect, special_flags))
+        for sequence in page_blits:
+            if sequence:
+                surface.blits(sequence, doreturn=False)
+
+
+def pack(images, page_size=PAGE_SIZE):
+    """Pack a dictionary of names to surfaces into a TextureAtlas.
+
+    Sprites are placed on shelves from the tallest down. A sprite larger than a page gets a page of its own.
+    The pages are converted to the display's pixel format, so the display mode has to be set first.
+    """
+    placements = {}
+    page_sizes = []
+    shelf_page = None
+    x = y = shelf_height = 0
+    for name in sorted(images, key=lambda name: (images[name].get_height(), images[name].get_width()), reverse=True):
+        width, height = images[name].get_size()
+        if width + PADDING > page_size or height + PADDING > page_size:
+            page_sizes.append([width, height])
+            placements[name] = (len(page_sizes) - 1, pygame.Rect(0, 0, width, height))
+            continue
+        if shelf_page is None or x + width > page_size: # Start a new shelf
+            x = 0
+            y += shelf_height
+            shelf_height = 0
+        if shelf_page is None or y + height > page_size: # Start a new page
+            page_sizes.append([0, 0])
+            shelf_page = len(page_sizes) - 1
+            x = y = shelf_height = 0
+
+        rect = pygame.Rect(x, y, width, height)
+        placements[name] = (shelf_page, rect)
+        used = page_sizes[shelf_page] # Pages are cropped to the area used
+        used[0], used[1] = max(used[0], rect.right), max(used[1], rect.bottom)
+        x += width + PADDING
+        shelf_height = max(shelf_height, height + PADDING)
+
+    pages = [pygame.Surface(size, pygame.SRCALPHA) for size in page_sizes]
+    for name, (page, rect) in placements.items():
+        pages[page].blit(images[name], rect)
+    return TextureAtlas([page.convert_alpha() for page in pages], placements)
+
+
+def _image_paths():
+    """Return a dictionary of sprite names to image paths.
+
+    Images in constants.IMAGES are used over ones in constants.DEFAULT_IMAGES.
+    """
+    paths = {}
+    for directory in (constants.DEFAULT_IMAGES, constants.IMAGES):
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".png"):
+                paths[entry.name[:-4]] = entry.path
+    return paths
+
+
+def _load_cached(paths, newest):
+    """Return the cached atlas, or None if it is missing or older than newest."""
+    try:
+        with open(os.path.join(constants.ATLAS_CACHE, INDEX_NAME)) as index_file:
+            index = json.load(index_file)
+        if index["version"] != INDEX_VERSION or index["newest"] < newest or set(index["rects"]) != set(paths):
+            return None
+        pages = [
+            pygame.image.load(os.path.join(constants.ATLAS_CACHE, page_name)).convert_alpha()
+            for page_name in index["pages"]
+        ]
+    except (OSError, ValueError, KeyError, pygame.error):
+        return None
+    rects = {name: (page, pygame.Rect(rect)) for name, (page, rect) in index["rects"].items()}
+    return TextureAtlas(pages, rects)
+
+
+def _save_cached(atlas, newest):
+    """Save an atlas to the cache. Failing to save it is ignored."""
+    page_names = ["atlas-{}.png".format(i) for i in range(len(atlas.pages))]
+    index = {
+        "version": INDEX_VERSION,
+        "newest": newest,
+        "pages": page_names,
+        "rects": {name: (page, tuple(rect)) for name, (page, rect) in atlas.rects.items()},
+    }
+    try:
+        os.makedirs(constants.ATLAS_CACHE, exist_ok=True)
+        for page, page_name in zip(atlas.pages, page_names):
+            pygame.image.save(page, os.path.join(constants.ATLAS_CACHE, page_name))
+        with open(os.path.join(constants.ATLAS_CACHE, INDEX_NAME), 'w') as index_file:
+            json.dump(index, index_file)
+    except (OSError, pygame.error):
+        pass
+
+
+def load():
+    """Return the atlas of all images, loading it from the cache or packing it if the cache is out of date.
+
+    The display mode has to be set first.
+    """
+    paths = _image_paths()
+    newest = max(os.path.getmtime(path) for path in paths.values())
+    atlas = _load_cached(paths, newest)
+    if atlas is None:
+        atlas = pack({name: pygame.image.load(path).convert_alpha() for name, path in paths.items()})
+        _save_cached(atlas, newest)
+    return atlas